@@ -1,4 +1,45 @@
 import requests, json
+import gzip
+import heapq
+import time
+import queue
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+from api_metrics import requestMetrics
+
+
+# HTTP adapter that enables TCP keep-alive on the pooled connections, so idle connections to the cluster are not
+# silently dropped by firewalls between requests
+class KeepAliveAdapter(HTTPAdapter):
+
+    def __init__(self, keepAliveIdle=60, keepAliveInterval=10, keepAliveCount=5, **kwargs):
+        self.socketOptions = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            self.socketOptions += [
+                (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, keepAliveIdle),
+                (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, keepAliveInterval),
+                (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, keepAliveCount)
+            ]
+        super(KeepAliveAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = HTTPConnection.default_socket_options + self.socketOptions
+        super(KeepAliveAdapter, self).init_poolmanager(*args, **kwargs)
+
+
+# Retry policy that only retries POST requests on the statuses of requests the cluster did not process. A proxy can
+# answer 502 or 504 after the cluster created a monitor, retrying it would create a duplicate
+class MethodAwareRetry(Retry):
+    postStatuses = (429, 503)
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method.upper() == "POST" and status_code not in self.postStatuses:
+            return False
+        return super(MethodAwareRetry, self).is_retry(method, status_code, has_retry_after)
 
 
 class API(object):
@@ -8,33 +49,185 @@ class API(object):
         self.endpoints = None
         self.cluster_name = None
         self.cluster_status = None
+        self.compress = False
+        self.timeout = (5, 60)  # (connect, read) timeouts in seconds
         self.session = requests.Session()
+        # Node selection: healthy endpoints sorted by latency, spread with "least-loaded" (in flight requests,
+        # ties going to the fastest node), "round-robin" or "pinned" (always the fastest node)
+        self.loadBalancing = "least-loaded"
+        self.probeTimeout = 2
+        self.endpointCooldown = 30
+        self.healthyEndpoints = []
+        self.endpointLatency = {}
+        self.endpointDownUntil = {}
+        self.inFlight = {}
+        self.roundRobin = 0
+        self.endpointLock = threading.Lock()
+        # Every request is recorded in the process wide request metrics, see api_metrics.py
+        self.metrics = requestMetrics
+        self.configureSession()
+
+    # Mount an HTTP adapter with the given connection pool and retry policy. Requests answered with a status of
+    # statusForcelist (only 429 and 503 for POST requests) or failing to connect are retried with exponential backoff,
+    # honouring Retry-After.
+    # With compress, JSON request bodies are sent gzipped (responses are always requested gzipped).
+    # When the requests are spread across several healthy endpoints, failing connections are not retried on the same
+    # node: sendToEndpoint fails over to the next endpoint at once.
+    def configureSession(self, poolConnections=10, poolMaxsize=10, poolBlock=False, retries=3, backoffFactor=0.5,
+                         statusForcelist=(429, 502, 503, 504), keepAliveIdle=60, compress=False):
+        self.sessionOptions = {
+            "poolConnections": poolConnections,
+            "poolMaxsize": poolMaxsize,
+            "poolBlock": poolBlock,
+            "retries": retries,
+            "backoffFactor": backoffFactor,
+            "statusForcelist": statusForcelist,
+            "keepAliveIdle": keepAliveIdle,
+            "compress": compress
+        }
+        retryArgs = {
+            "total": retries,
+            "connect": 0 if len(self.healthyEndpoints) > 1 else retries,
+            "read": 0,
+            "status": retries,
+            "backoff_factor": backoffFactor,
+            "status_forcelist": statusForcelist,
+            "respect_retry_after_header": True,
+            "raise_on_status": False
+        }
+        # Retry every method, the alerting and search endpoints are used through POST. urllib3 < 1.26 names the
+        # argument method_whitelist.
+        if "allowed_methods" in Retry.__init__.__code__.co_varnames:
+            retryArgs["allowed_methods"] = False
+        else:
+            retryArgs["method_whitelist"] = False
+        adapter = KeepAliveAdapter(keepAliveIdle=keepAliveIdle, pool_connections=poolConnections, pool_maxsize=poolMaxsize,
+                                   pool_block=poolBlock, max_retries=MethodAwareRetry(**retryArgs))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"})
+        self.compress = compress
+
+    # Pick the endpoint of the next request among the healthy ones that are not cooling down after a failure
+    def selectEndpoint(self):
+        with self.endpointLock:
+            now = time.monotonic()
+            candidates = [endpoint for endpoint in self.healthyEndpoints if self.endpointDownUntil.get(endpoint, 0) <= now]
+            if not candidates:
+                candidates = self.healthyEndpoints
+            if self.loadBalancing == "round-robin":
+                endpoint = candidates[self.roundRobin % len(candidates)]
+                self.roundRobin += 1
+            elif self.loadBalancing == "least-loaded":
+                endpoint = min(candidates, key=lambda endpoint: self.inFlight.get(endpoint, 0))
+            else:
+                endpoint = candidates[0]
+            self.inFlight[endpoint] = self.inFlight.get(endpoint, 0) + 1
+            return endpoint
+
+    # Send a request and record it in the request metrics: time, bytes, took, status and the retries of the session
+    # retry policy and of the endpoint failover
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        event = self.metrics.requestStarted(method, url, kwargs.get("data"))
+        try:
+            result = self.sendToEndpoint(method, url, event, **kwargs)
+        except Exception as e:
+            self.metrics.requestFinished(event, error="%s: %s" % (e.__class__.__name__, e))
+            raise
+        if event is not None:
+            retries = getattr(result.raw, "retries", None)
+            if retries is not None:
+                event["retries"] += len(retries.history)
+            contentLength = result.headers.get("Content-Length")
+            self.metrics.requestFinished(event, result.status_code, result.content, int(contentLength) if contentLength and contentLength.isdigit() else None)
+        return result
+
+    # Requests to the valid endpoint are spread across the healthy endpoints and fail over to the next endpoint when
+    # a node cannot be reached. Read timeouts are not failed over, the node may have processed the request.
+    def sendToEndpoint(self, method, url, event=None, **kwargs):
+        if not self.validEndpoint or len(self.healthyEndpoints) < 2 or not url.startswith(self.validEndpoint):
+            return self.session.request(method, url, **kwargs)
+        path = url[len(self.validEndpoint):]
+        attempts = len(self.healthyEndpoints)
+        for attempt in range(attempts):
+            endpoint = self.selectEndpoint()
+            try:
+                return self.session.request(method, endpoint + path, **kwargs)
+            except requests.ConnectionError as e:
+                print("WARNING: Endpoint %s failed (%s), failing over to the next endpoint" % (endpoint, e.__class__.__name__))
+                if event is not None and attempt < attempts - 1:
+                    event["retries"] += 1
+                with self.endpointLock:
+                    self.endpointDownUntil[endpoint] = time.monotonic() + self.endpointCooldown
+                if attempt == attempts - 1:
+                    raise
+            finally:
+                with self.endpointLock:
+                    self.inFlight[endpoint] -= 1
+
+    def send(self, method, url, payload):
+        headers = {"Content-type": "application/json; charset=utf-8"}
+        if payload is None:
+            return self.request(method, url, headers=headers)
+        data = json.dumps(payload).encode("utf-8")
+        if self.compress:
+            data = gzip.compress(data)
+            headers["Content-Encoding"] = "gzip"
+        return self.request(method, url, data=data, headers=headers)
 
     def get(self, url):
-        req = self.session.get(url)
+        req = self.request("GET", url)
         return req
 
     def post(self, url, payload):
-        headers = {"Content-type": "application/json; charset=utf-8"}
-        req = self.session.post(url, json=payload, headers=headers)
+        req = self.send("POST", url, payload)
         return req
 
     def put(self, url, payload):
-        headers = {"Content-type": "application/json; charset=utf-8"}
-        req = self.session.put(url, json=payload, headers=headers)
+        req = self.send("PUT", url, payload)
+        return req
+
+    def delete(self, url, payload=None):
+        req = self.send("DELETE", url, payload)
         return req
 
-    # Get from the endpoints list a valid endpoint
+    # Probe an endpoint once with a short timeout and no retries, returns the latency in seconds or None
+    def probeEndpoint(self, probeSession, endpoint):
+        try:
+            start = time.monotonic()
+            result = probeSession.get(endpoint + "_cluster/health", timeout=self.probeTimeout)
+            latency = time.monotonic() - start
+        except requests.RequestException as e:
+            print("Endpoint %s is not reachable (%s)" % (endpoint, e.__class__.__name__))
+            return None
+        if result.status_code != 200:
+            print("Endpoint %s returned HTTP status code %s" % (endpoint, result.status_code))
+            return None
+        return latency
+
+    # Probe every endpoint of the endpoints list concurrently, the valid endpoint is the fastest healthy one
     def getValidEndpoint(self):
         print("Looking for a valid endpoint from the provided endpoints list")
-        for endpoint in self.endpoints:
-            result = self.get(endpoint + "_cluster/health")
-            if result.status_code == 200:
-                self.validEndpoint = endpoint
-                print("Valid endpoint found at %s" % self.validEndpoint)
-                return True
-        print("ERROR: No valid endpoint found!")
-        return False
+        probeSession = requests.Session()
+        probeSession.auth = self.session.auth
+        probeSession.verify = self.session.verify
+        with ThreadPoolExecutor(max_workers=max(1, len(self.endpoints))) as executor:
+            latencies = list(executor.map(lambda endpoint: self.probeEndpoint(probeSession, endpoint), self.endpoints))
+        probeSession.close()
+        with self.endpointLock:
+            self.endpointLatency = {endpoint: latency for endpoint, latency in zip(self.endpoints, latencies) if latency is not None}
+            self.healthyEndpoints = sorted(self.endpointLatency, key=self.endpointLatency.get)
+            self.endpointDownUntil = {}
+        if not self.healthyEndpoints:
+            print("ERROR: No valid endpoint found!")
+            return False
+        self.validEndpoint = self.healthyEndpoints[0]
+        # Mount the adapter again so the connect retries match the number of healthy endpoints
+        self.configureSession(**self.sessionOptions)
+        for endpoint in self.healthyEndpoints:
+            print("Valid endpoint found at %s (%.0f ms)" % (endpoint, self.endpointLatency[endpoint] * 1000))
+        return True
 
     def checkClusterHealth(self):
         print("Checking cluster status...")
@@ -58,25 +251,142 @@ class API(object):
             print("Received HTTP status code %s." % result.status_code)
             return False
 
+    # Return the distribution ("opensearch", "opendistroforelasticsearch"...) and the (major, minor) version of the
+    # cluster, None on error
+    def getClusterVersion(self):
+        result = self.get(self.validEndpoint)
+        if result.status_code != 200:
+            print("ERROR: Received HTTP status code %s retrieving the cluster version" % result.status_code)
+            return None
+        version = result.json().get("version", {})
+        number = tuple(int(part) for part in version.get("number", "0.0").split(".")[:2] if part.isdigit())
+        return version.get("distribution", "elasticsearch"), number
+
     def createMonitor(self, payload):
-        print("Creating monitor...")
+        print("Creating monitor %s..." % payload["name"])
         result = self.post(self.validEndpoint + "_opendistro/_alerting/monitors", payload)
         content = result.json()
         if result.status_code == 201:
             print("Succesfull: monitor ID = %s" % content["_id"])
+            return True
         else:
             print("ERROR: Received HTTP status code %s:" % result.status_code)
             print("  - Error type: %s" % content["error"]["root_cause"][0]["type"])
             print("  - Error reason: %s" % content["error"]["root_cause"][0]["reason"])
+            return False
 
-    def putIndexSettings(self, index, payload):
+    def updateMonitor(self, monitorId, payload):
+        print("Updating monitor %s..." % payload["name"])
+        result = self.put(self.validEndpoint + "_opendistro/_alerting/monitors/" + monitorId, payload)
+        content = result.json()
+        if result.status_code == 200:
+            print("Succesfull: monitor ID = %s" % content["_id"])
+            return True
+        else:
+            print("ERROR: Received HTTP status code %s:" % result.status_code)
+            print("  - Error type: %s" % content["error"]["root_cause"][0]["type"])
+            print("  - Error reason: %s" % content["error"]["root_cause"][0]["reason"])
+            return False
+
+    def deleteMonitor(self, monitorId):
+        print("Deleting monitor %s..." % monitorId)
+        result = self.delete(self.validEndpoint + "_opendistro/_alerting/monitors/" + monitorId)
+        if result.status_code == 200:
+            print("Succesfull: monitor ID = %s deleted" % monitorId)
+            return True
+        else:
+            print("ERROR: Received HTTP status code %s deleting monitor %s" % (result.status_code, monitorId))
+            return False
+
+    # Return every existing monitor as a list of (monitor ID, monitor) tuples, paging with search_after
+    def searchMonitors(self, pageSize=10000):
+        print("Retrieving existing monitors")
+        body = {"size": pageSize, "query": {"exists": {"field": "monitor.name"}}, "sort": [{"_id": {"order": "asc"}}]}
+        monitors = []
+        while True:
+            result = self.post(self.validEndpoint + "_opendistro/_alerting/monitors/_search", body)
+            content = result.json()
+            if result.status_code != 200:
+                print("ERROR: Received HTTP status code %s:" % result.status_code)
+                print("  - Error type: %s" % content["error"]["root_cause"][0]["type"])
+                print("  - Error reason: %s" % content["error"]["root_cause"][0]["reason"])
+                return None
+            hits = content["hits"]["hits"]
+            for hit in hits:
+                monitors.append((hit["_id"], hit["_source"].get("monitor", hit["_source"])))
+            if len(hits) < pageSize:
+                break
+            body["search_after"] = hits[-1]["sort"]
+        print("Found %s existing monitors" % len(monitors))
+        return monitors
+
+    # Apply settings to an index, a comma separated list of indices or patterns. With ignoreUnavailable the
+    # missing indices are skipped and patterns matching nothing are not an error
+    def putIndexSettings(self, index, payload, ignoreUnavailable=False):
         print("Applying payload on index %s" % index)
-        result = self.put(self.validEndpoint + index + "/_settings?pretty", payload)
+        url = self.validEndpoint + index + "/_settings?pretty"
+        if ignoreUnavailable:
+            url += "&ignore_unavailable=true&allow_no_indices=true&expand_wildcards=open"
+        result = self.put(url, payload)
         content = result.json()
         if result.status_code == 200:
             print("Successfully applied settings, response: %s" % content)
+            return True
         else:
             print("ERROR: Received HTTP status code %s, error: %s" % (result.status_code, content["error"]))
+            return False
+
+    # Return the names of the open indices matching the index patterns, resolved with _resolve/index in one call
+    # or with _cat/indices on clusters without it. None on error
+    def resolveIndices(self, patterns):
+        target = ",".join(patterns)
+        result = self.get(self.validEndpoint + "_resolve/index/" + target + "?expand_wildcards=open")
+        if result.status_code == 200:
+            return sorted(index["name"] for index in result.json()["indices"])
+        result = self.get(self.validEndpoint + "_cat/indices/" + target + "?format=json&h=index&expand_wildcards=open")
+        if result.status_code == 200:
+            return sorted(row["index"] for row in result.json())
+        if result.status_code == 404:
+            return []
+        print("ERROR: Received HTTP status code %s resolving indices %s, error: %s" % (result.status_code, target, result.text))
+        return None
+
+    # Create or replace a legacy index template, applied to the new indices matching its index_patterns merged
+    # with the other matching templates by their order
+    def putTemplate(self, name, payload):
+        print("Applying index template %s" % name)
+        result = self.put(self.validEndpoint + "_template/" + name, payload)
+        if result.status_code == 200:
+            print("Successfully applied index template %s" % name)
+            return True
+        print("ERROR: Received HTTP status code %s, error: %s" % (result.status_code, result.text))
+        return False
+
+    # Return the flat settings of the indices, {index: {"settings": {...}, "defaults": {...}}}, optionally only the
+    # requested setting names. None on error
+    def getIndexSettings(self, index, names=None, ignoreUnavailable=False):
+        url = self.validEndpoint + index + "/_settings"
+        if names:
+            url += "/" + ",".join(names)
+        url += "?flat_settings=true&include_defaults=true"
+        if ignoreUnavailable:
+            url += "&ignore_unavailable=true&allow_no_indices=true&expand_wildcards=open"
+        result = self.get(url)
+        if result.status_code == 200:
+            return result.json()
+        print("ERROR: Received HTTP status code %s reading settings of %s, error: %s" % (result.status_code, index, result.text))
+        return None
+
+    # Return the indexing stats of the primary shards of the indices, summed up. None on error
+    def getIndexingStats(self, index, ignoreUnavailable=False):
+        url = self.validEndpoint + index + "/_stats/indexing"
+        if ignoreUnavailable:
+            url += "?ignore_unavailable=true&allow_no_indices=true&expand_wildcards=open"
+        result = self.get(url)
+        if result.status_code == 200:
+            return result.json()["_all"]["primaries"].get("indexing", {})
+        print("ERROR: Received HTTP status code %s reading indexing stats of %s, error: %s" % (result.status_code, index, result.text))
+        return None
 
     def search(self, index, payload):
         print("Searching on index %s with requested payload" % index)
@@ -91,3 +401,189 @@ class API(object):
             print("  - Error type: %s" % content["error"]["root_cause"][0]["type"])
             print("  - Error reason: %s" % content["error"]["root_cause"][0]["reason"])
 
+
+    # Open a point in time on the given index, returns its id or None if the cluster does not support it
+    def openPointInTime(self, index, keepAlive="1m"):
+        result = self.post(self.validEndpoint + index + "/_pit?keep_alive=" + keepAlive, None)
+        if result.status_code == 200:
+            return result.json()["id"]
+        # OpenSearch exposes the same feature under a different endpoint
+        result = self.post(self.validEndpoint + index + "/_search/point_in_time?keep_alive=" + keepAlive, None)
+        if result.status_code == 200:
+            return result.json()["pit_id"]
+        return None
+
+    def closePointInTime(self, pitId):
+        result = self.delete(self.validEndpoint + "_pit", {"id": pitId})
+        if result.status_code != 200:
+            self.delete(self.validEndpoint + "_search/point_in_time", {"pit_id": [pitId]})
+
+    # Generator that pages through every hit matching the payload using search_after, yields one list of hits per page.
+    # A point in time is used when available so the pages are consistent, otherwise search_after runs against the live index.
+    def searchAfter(self, index, payload, pageSize=1000, keepAlive="1m", tiebreaker="_id"):
+        print("Streaming search on index %s with requested payload, page size %s" % (index, pageSize))
+        body = {key: value for key, value in payload.items() if key not in ("size", "from", "aggs", "aggregations")}
+        body["size"] = pageSize
+        body["track_total_hits"] = False
+        body["sort"] = list(payload.get("sort", [{"@timestamp": {"order": "desc"}}]))
+        pitId = self.openPointInTime(index, keepAlive)
+        if pitId:
+            # Searches with a point in time get the implicit _shard_doc tiebreaker
+            url = self.validEndpoint + "_search"
+        else:
+            print("Point in time not available, paging over the live index")
+            url = self.validEndpoint + index + "/_search"
+            body["sort"].append({tiebreaker: {"order": "asc"}})
+        total = 0
+        try:
+            while True:
+                if pitId:
+                    body["pit"] = {"id": pitId, "keep_alive": keepAlive}
+                result = self.post(url, body)
+                content = result.json()
+                if result.status_code != 200:
+                    print("ERROR: Received HTTP status code %s:" % result.status_code)
+                    print("  - Error type: %s" % content["error"]["root_cause"][0]["type"])
+                    print("  - Error reason: %s" % content["error"]["root_cause"][0]["reason"])
+                    raise RuntimeError("Streaming search failed after %s hits" % total)
+                hits = content["hits"]["hits"]
+                if not hits:
+                    break
+                total += len(hits)
+                yield hits
+                if len(hits) < pageSize:
+                    break
+                body["search_after"] = hits[-1]["sort"]
+                pitId = content.get("pit_id", pitId)
+        finally:
+            if pitId:
+                self.closePointInTime(pitId)
+            print("Streaming search finished, retrieved %s hits" % total)
+
+    # Generator that pages through the buckets of a composite aggregation with after_key, yields one list of buckets
+    # per page. Only the query of the payload is used, no hits are returned. Sub aggregations (e.g. top_hits) are
+    # computed for every bucket.
+    def compositeAggregation(self, index, payload, sources, pageSize=1000, subAggregations=None, name="composite"):
+        print("Composite aggregation on index %s with requested payload, page size %s" % (index, pageSize))
+        composite = {"size": pageSize, "sources": sources}
+        aggregation = {"composite": composite}
+        if subAggregations:
+            aggregation["aggs"] = subAggregations
+        body = {"size": 0, "track_total_hits": False, "query": payload.get("query", {"match_all": {}}), "aggs": {name: aggregation}}
+        total = 0
+        while True:
+            result = self.post(self.validEndpoint + index + "/_search", body)
+            content = result.json()
+            if result.status_code != 200:
+                print("ERROR: Received HTTP status code %s:" % result.status_code)
+                print("  - Error type: %s" % content["error"]["root_cause"][0]["type"])
+                print("  - Error reason: %s" % content["error"]["root_cause"][0]["reason"])
+                raise RuntimeError("Composite aggregation failed after %s buckets" % total)
+            buckets = content["aggregations"][name]["buckets"]
+            if buckets:
+                total += len(buckets)
+                yield buckets
+            afterKey = content["aggregations"][name].get("after_key")
+            if len(buckets) < pageSize or afterKey is None:
+                break
+            composite["after"] = afterKey
+        print("Composite aggregation finished, retrieved %s buckets" % total)
+
+    # Generator that scrolls through a single slice of a sliced scroll, yields one list of hits per page
+    def scrollSlice(self, index, payload, sliceId, sliceMax, pageSize=1000, keepAlive="1m", stop=None, sort=True):
+        body = {key: value for key, value in payload.items() if key not in ("size", "from", "aggs", "aggregations")}
+        body["size"] = pageSize
+        if not sort:
+            # Index order is the cheapest way to scroll when the result does not need to be sorted
+            body["sort"] = ["_doc"]
+        if sliceMax > 1:
+            body["slice"] = {"id": sliceId, "max": sliceMax}
+        result = self.post(self.validEndpoint + index + "/_search?scroll=" + keepAlive, body)
+        scrollId = None
+        try:
+            while True:
+                content = result.json()
+                if result.status_code != 200:
+                    print("ERROR: Slice %s received HTTP status code %s:" % (sliceId, result.status_code))
+                    print("  - Error type: %s" % content["error"]["root_cause"][0]["type"])
+                    print("  - Error reason: %s" % content["error"]["root_cause"][0]["reason"])
+                    raise RuntimeError("Scroll of slice %s failed" % sliceId)
+                scrollId = content.get("_scroll_id", scrollId)
+                hits = content["hits"]["hits"]
+                if not hits or (stop is not None and stop.is_set()):
+                    break
+                yield hits
+                result = self.post(self.validEndpoint + "_search/scroll", {"scroll": keepAlive, "scroll_id": scrollId})
+        finally:
+            if scrollId:
+                self.delete(self.validEndpoint + "_search/scroll", {"scroll_id": [scrollId]})
+
+    # Export the hits matching the payload running one sliced scroll per slice on a thread pool.
+    # Unordered, pages are yielded as soon as any slice receives them. Ordered, the hits of every slice are merged
+    # on the first sort field of the payload and yielded one page at a time, which needs one worker per slice.
+    def slicedSearch(self, index, payload, slices=4, workers=None, pageSize=1000, keepAlive="1m", ordered=False, bufferPages=4):
+        workers = workers or slices
+        if ordered and workers < slices:
+            print("Ordered sliced search needs one worker per slice, using %s workers" % slices)
+            workers = slices
+        print("Sliced search on index %s with %s slices and %s workers" % (index, slices, workers))
+        stop = threading.Event()
+        done = object()
+        queues = [queue.Queue(maxsize=bufferPages) for _ in range(slices if ordered else 1)]
+
+        def put(q, item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+        def worker(sliceId):
+            q = queues[sliceId if ordered else 0]
+            try:
+                for hits in self.scrollSlice(index, payload, sliceId, slices, pageSize, keepAlive, stop, ordered):
+                    put(q, hits)
+            except Exception as e:
+                put(q, e)
+            finally:
+                put(q, done)
+
+        def drain(q, producers):
+            finished = 0
+            while finished < producers:
+                item = q.get()
+                if item is done:
+                    finished += 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+
+        total = 0
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for sliceId in range(slices):
+                executor.submit(worker, sliceId)
+            if ordered:
+                sortField = payload.get("sort", [{"@timestamp": {"order": "desc"}}])[0]
+                reverse = isinstance(sortField, dict) and list(sortField.values())[0].get("order") == "desc"
+                streams = [(hit for hits in drain(q, 1) for hit in hits) for q in queues]
+                page = []
+                for hit in heapq.merge(*streams, key=lambda hit: hit["sort"][0], reverse=reverse):
+                    page.append(hit)
+                    if len(page) == pageSize:
+                        total += len(page)
+                        yield page
+                        page = []
+                if page:
+                    total += len(page)
+                    yield page
+            else:
+                for hits in drain(queues[0], slices):
+                    total += len(hits)
+                    yield hits
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
+            print("Sliced search finished, retrieved %s hits" % total)
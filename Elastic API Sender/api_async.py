@@ -0,0 +1,255 @@
+import os
+import ssl
+import time
+import json
+import asyncio
+import aiohttp
+from api_metrics import requestMetrics
+
+
+# asyncio counterpart of the API class: same methods as coroutines, sharing one aiohttp session whose concurrent
+# requests are limited by a semaphore. Use it as an async context manager:
+#   async with AsyncAPI(concurrency=100) as api:
+#       await asyncio.gather(*[api.createMonitor(payload) for payload in payloads])
+class AsyncAPI(object):
+    # Statuses retried, POST requests are only retried when the cluster did not process them
+    retryStatuses = (429, 502, 503, 504)
+    postRetryStatuses = (429, 503)
+
+    def __init__(self, concurrency=50, retries=3, backoff=0.5, timeout=60):
+        self.validEndpoint = None
+        self.endpoints = None
+        self.cluster_name = None
+        self.cluster_status = None
+        self.verify = True  # like requests: True, a CA certificate file or directory, or a false value to skip the verification
+        self.auth = None  # (username, password)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.probeTimeout = 2
+        self.healthyEndpoints = []
+        self.endpointLatency = {}
+        self.roundRobin = 0
+        self.session = None
+        self.semaphore = None
+        self.metrics = requestMetrics
+
+    # Copy the endpoint and session settings of an already initialized API object
+    @classmethod
+    def fromAPI(cls, api, concurrency=50, retries=3, backoff=0.5):
+        asyncApi = cls(concurrency, retries, backoff)
+        asyncApi.endpoints = api.endpoints
+        asyncApi.validEndpoint = api.validEndpoint
+        asyncApi.healthyEndpoints = list(api.healthyEndpoints)
+        asyncApi.endpointLatency = dict(api.endpointLatency)
+        asyncApi.cluster_name = api.cluster_name
+        asyncApi.cluster_status = api.cluster_status
+        asyncApi.verify = api.session.verify
+        asyncApi.auth = api.session.auth
+        return asyncApi
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, excType, exc, tb):
+        await self.close()
+
+    async def open(self):
+        if self.verify is True:
+            sslContext = None
+        elif not self.verify:
+            sslContext = False
+        elif os.path.isdir(self.verify):
+            sslContext = ssl.create_default_context(capath=self.verify)
+        else:
+            sslContext = ssl.create_default_context(cafile=self.verify)
+        auth = aiohttp.BasicAuth(*self.auth) if self.auth else None
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ssl=sslContext)
+        self.session = aiohttp.ClientSession(connector=connector, auth=auth, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    # Endpoints to try for a request as (endpoint, URL) tuples: requests to the valid endpoint are spread round-robin
+    # across the healthy endpoints, the following ones being the failover order
+    def endpointUrls(self, url):
+        if not self.validEndpoint or len(self.healthyEndpoints) < 2 or not url.startswith(self.validEndpoint):
+            return [(self.validEndpoint, url)]
+        path = url[len(self.validEndpoint):]
+        first = self.roundRobin
+        self.roundRobin += 1
+        endpoints = [self.healthyEndpoints[(first + i) % len(self.healthyEndpoints)] for i in range(len(self.healthyEndpoints))]
+        return [(endpoint, endpoint + path) for endpoint in endpoints]
+
+    # Perform a request and return (status code, headers, decoded JSON content), retrying with exponential backoff
+    # on HTTP 429/502/503/504 (429/503 for POST requests) and honouring Retry-After, and failing over to the next
+    # healthy endpoint when a node cannot be reached. The request is recorded in the request metrics
+    async def request(self, method, url, payload=None):
+        headers = {"Content-type": "application/json; charset=utf-8"}
+        data = json.dumps(payload) if payload is not None else None
+        event = self.metrics.requestStarted(method, url, data)
+        urls = self.endpointUrls(url)
+        retryStatuses = self.postRetryStatuses if method.upper() == "POST" else self.retryStatuses
+        attempt = 0
+        failovers = 0
+        try:
+            while True:
+                async with self.semaphore:
+                    while True:
+                        endpoint, endpointUrl = urls[0]
+                        try:
+                            async with self.session.request(method, endpointUrl, data=data, headers=headers) as response:
+                                status = response.status
+                                responseHeaders = response.headers
+                                text = await response.text()
+                            break
+                        except aiohttp.ClientConnectorError as e:
+                            if len(urls) == 1:
+                                raise
+                            print("WARNING: Endpoint %s failed (%s), failing over to the next endpoint" % (endpoint, e.__class__.__name__))
+                            urls = urls[1:]
+                            failovers += 1
+                if status not in retryStatuses or attempt >= self.retries:
+                    break
+                retryAfter = responseHeaders.get("Retry-After")
+                delay = float(retryAfter) if retryAfter and retryAfter.isdigit() else self.backoff * (2 ** attempt)
+                attempt += 1
+                await asyncio.sleep(delay)
+        except Exception as e:
+            if event is not None:
+                event["retries"] = attempt + failovers
+            self.metrics.requestFinished(event, error="%s: %s" % (e.__class__.__name__, e))
+            raise
+        if event is not None:
+            event["retries"] = attempt + failovers
+            contentLength = responseHeaders.get("Content-Length")
+            self.metrics.requestFinished(event, status, text, int(contentLength) if contentLength and contentLength.isdigit() else None)
+        try:
+            content = json.loads(text) if text else {}
+        except ValueError:
+            # Error pages that are not JSON, e.g. the HTML answer of a proxy
+            content = {"error": text}
+        return status, responseHeaders, content
+
+    async def get(self, url):
+        return await self.request("GET", url)
+
+    async def post(self, url, payload):
+        return await self.request("POST", url, payload)
+
+    async def put(self, url, payload):
+        return await self.request("PUT", url, payload)
+
+    async def delete(self, url, payload=None):
+        return await self.request("DELETE", url, payload)
+
+    def printError(self, status, content):
+        print("ERROR: Received HTTP status code %s:" % status)
+        try:
+            print("  - Error type: %s" % content["error"]["root_cause"][0]["type"])
+            print("  - Error reason: %s" % content["error"]["root_cause"][0]["reason"])
+        except (KeyError, IndexError, TypeError):
+            print("  - Error: %s" % content)
+
+    # Probe an endpoint once with a short timeout, returns the latency in seconds or None
+    async def probeEndpoint(self, endpoint):
+        try:
+            start = time.monotonic()
+            async with self.session.get(endpoint + "_cluster/health", timeout=aiohttp.ClientTimeout(total=self.probeTimeout)) as response:
+                status = response.status
+            latency = time.monotonic() - start
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print("Endpoint %s is not reachable (%s)" % (endpoint, e.__class__.__name__))
+            return None
+        if status != 200:
+            print("Endpoint %s returned HTTP status code %s" % (endpoint, status))
+            return None
+        return latency
+
+    # Probe every endpoint of the endpoints list concurrently, the valid endpoint is the fastest healthy one
+    async def getValidEndpoint(self):
+        print("Looking for a valid endpoint from the provided endpoints list")
+        latencies = await asyncio.gather(*[self.probeEndpoint(endpoint) for endpoint in self.endpoints])
+        self.endpointLatency = {endpoint: latency for endpoint, latency in zip(self.endpoints, latencies) if latency is not None}
+        self.healthyEndpoints = sorted(self.endpointLatency, key=self.endpointLatency.get)
+        if not self.healthyEndpoints:
+            print("ERROR: No valid endpoint found!")
+            return False
+        self.validEndpoint = self.healthyEndpoints[0]
+        print("Valid endpoint found at %s (%.0f ms)" % (self.validEndpoint, self.endpointLatency[self.validEndpoint] * 1000))
+        return True
+
+    async def checkClusterHealth(self):
+        print("Checking cluster status...")
+        status, headers, content = await self.get(self.validEndpoint + "_cluster/health")
+        if status == 200:
+            self.cluster_name = content["cluster_name"]
+            self.cluster_status = content["status"]
+            if self.cluster_status == "red":
+                print("WARNING: Cluster status is red!")
+                return False
+            elif self.cluster_status == "yellow":
+                print("Cluster status is yellow")
+                return True
+            elif self.cluster_status == "green":
+                print("Cluster status is green")
+                return True
+            else:
+                print("Cluster status is unknown, received status: %s" % self.cluster_status)
+                return False
+        else:
+            print("Received HTTP status code %s." % status)
+            return False
+
+    async def createMonitor(self, payload):
+        print("Creating monitor %s..." % payload["name"])
+        status, headers, content = await self.post(self.validEndpoint + "_opendistro/_alerting/monitors", payload)
+        if status == 201:
+            print("Succesfull: monitor ID = %s" % content["_id"])
+            return True
+        self.printError(status, content)
+        return False
+
+    async def updateMonitor(self, monitorId, payload):
+        print("Updating monitor %s..." % payload["name"])
+        status, headers, content = await self.put(self.validEndpoint + "_opendistro/_alerting/monitors/" + monitorId, payload)
+        if status == 200:
+            print("Succesfull: monitor ID = %s" % content["_id"])
+            return True
+        self.printError(status, content)
+        return False
+
+    async def deleteMonitor(self, monitorId):
+        print("Deleting monitor %s..." % monitorId)
+        status, headers, content = await self.delete(self.validEndpoint + "_opendistro/_alerting/monitors/" + monitorId)
+        if status == 200:
+            print("Succesfull: monitor ID = %s deleted" % monitorId)
+            return True
+        self.printError(status, content)
+        return False
+
+    async def putIndexSettings(self, index, payload, ignoreUnavailable=False):
+        print("Applying payload on index %s" % index)
+        url = self.validEndpoint + index + "/_settings?pretty"
+        if ignoreUnavailable:
+            url += "&ignore_unavailable=true&allow_no_indices=true&expand_wildcards=open"
+        status, headers, content = await self.put(url, payload)
+        if status == 200:
+            print("Successfully applied settings, response: %s" % content)
+            return True
+        print("ERROR: Received HTTP status code %s, error: %s" % (status, content.get("error")))
+        return False
+
+    async def search(self, index, payload):
+        print("Searching on index %s with requested payload" % index)
+        status, headers, content = await self.post(self.validEndpoint + index + "/_search", payload)
+        if status == 200:
+            print("Search performed successfully, found %s hits" % str(content["hits"]["total"]["value"]))
+            return content
+        self.printError(status, content)
+        return None
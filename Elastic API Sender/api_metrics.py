@@ -0,0 +1,272 @@
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import threading
+from urllib.parse import urlsplit
+
+# Instrumentation of the requests sent by API and AsyncAPI: wall time, bytes sent and received, server "took",
+# retries and status code of every request, aggregated in latency histograms per method and endpoint.
+# Set ELASTIC_API_METRICS to export them when the script exits:
+#   ELASTIC_API_METRICS=/var/lib/node_exporter/textfile/create_monitors.prom   Prometheus textfile collector format
+#   ELASTIC_API_METRICS=metrics.json                                          JSON summary
+#   ELASTIC_API_METRICS=-                                                     summary table on the standard output
+# Hooks receive every request, e.g. to open and close tracing spans, see RequestMetrics.addHook
+
+# Upper bounds in seconds of the latency histogram buckets
+latencyBuckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Path segments kept in the endpoint names, the other ones (index names, IDs) are replaced by a placeholder
+endpointWords = {"health", "scroll", "point_in_time", "monitors", "index", "indices", "indexing"}
+
+tookPattern = re.compile(rb'"took"\s*:\s*(\d+)')
+
+
+# Endpoint of a URL without the index names and IDs, e.g. POST /{index}/_search
+def endpointName(path):
+    parts = [part for part in path.split("?", 1)[0].split("/") if part]
+    return "/" + "/".join(part if part.startswith("_") or part in endpointWords else "{name}" for part in parts)
+
+
+class EndpointStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.statuses = {}
+        self.seconds = 0.0
+        self.maxSeconds = 0.0
+        self.buckets = [0] * (len(latencyBuckets) + 1)
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.tookMs = 0
+        self.tookCount = 0
+        self.retries = 0
+
+    def add(self, event):
+        self.count += 1
+        status = str(event["status"]) if event["status"] is not None else "error"
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if event["status"] is None or event["status"] >= 400:
+            self.errors += 1
+        seconds = event["seconds"]
+        self.seconds += seconds
+        self.maxSeconds = max(self.maxSeconds, seconds)
+        for i, bound in enumerate(latencyBuckets):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        self.bytesSent += event["bytesSent"]
+        self.bytesReceived += event["bytesReceived"]
+        if event["took"] is not None:
+            self.tookMs += event["took"]
+            self.tookCount += 1
+        self.retries += event["retries"]
+
+    # Estimate of a quantile from the histogram, interpolating inside the bucket as Prometheus does
+    def quantile(self, fraction):
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        cumulative = 0
+        lower = 0.0
+        for i, bound in enumerate(latencyBuckets):
+            if cumulative + self.buckets[i] >= rank:
+                if not self.buckets[i]:
+                    return bound
+                return lower + (bound - lower) * (rank - cumulative) / self.buckets[i]
+            cumulative += self.buckets[i]
+            lower = bound
+        return self.maxSeconds
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "statuses": dict(self.statuses),
+            "seconds": {"sum": self.seconds, "max": self.maxSeconds, "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99)},
+            "buckets": {str(bound): count for bound, count in zip(latencyBuckets + ("+Inf",), self.buckets)},
+            "bytesSent": self.bytesSent,
+            "bytesReceived": self.bytesReceived,
+            "tookMs": self.tookMs,
+            "tookCount": self.tookCount,
+            "retries": self.retries
+        }
+
+
+def escapeLabel(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# Process wide aggregation of the requests, shared by every API and AsyncAPI object
+class RequestMetrics(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.hooks = []
+        self.enabled = True
+        self.started = time.time()
+        self.script = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0] or "python"
+
+    # A hook is a callable run when a request finishes, or an object with requestStarted(event) and/or
+    # requestFinished(event) methods. Both calls receive the same event dictionary, so a tracer can keep its span in
+    # it. The event has method, url, endpoint, started, and when finished status (None on connection errors),
+    # seconds, bytesSent, bytesReceived, took (ms, None when the response has none), retries and error
+    def addHook(self, hook):
+        with self.lock:
+            self.hooks.append(hook)
+
+    def removeHook(self, hook):
+        with self.lock:
+            self.hooks.remove(hook)
+
+    def requestStarted(self, method, url, data=None):
+        if not self.enabled:
+            return None
+        event = {
+            "method": method.upper(),
+            "url": url,
+            "endpoint": endpointName(urlsplit(url).path),
+            "started": time.time(),
+            "start": time.perf_counter(),
+            "bytesSent": len(data) if isinstance(data, (bytes, str)) else 0,
+            "retries": 0
+        }
+        for hook in self.hooks:
+            if hasattr(hook, "requestStarted"):
+                hook.requestStarted(event)
+        return event
+
+    # Complete the event of a request with its response: status, received bytes (the wire size when the server sends
+    # Content-Length) and took, or with the exception raised
+    def requestFinished(self, event, status=None, content=None, contentLength=None, error=None):
+        if event is None:
+            return
+        event["seconds"] = time.perf_counter() - event.pop("start")
+        event["status"] = status
+        event["bytesReceived"] = contentLength if contentLength is not None else len(content or b"")
+        event["took"] = None
+        if content:
+            match = tookPattern.search(content[:64] if isinstance(content, bytes) else content[:64].encode("utf-8", "ignore"))
+            if match:
+                event["took"] = int(match.group(1))
+        event["error"] = error
+        key = (event["method"], event["endpoint"])
+        with self.lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = EndpointStats()
+            stats.add(event)
+        for hook in self.hooks:
+            if hasattr(hook, "requestFinished"):
+                hook.requestFinished(event)
+            elif callable(hook):
+                hook(event)
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+            self.started = time.time()
+
+    def summary(self):
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            total = EndpointStats()
+            for key, stats in endpoints:
+                total.count += stats.count
+                total.errors += stats.errors
+                total.seconds += stats.seconds
+                total.maxSeconds = max(total.maxSeconds, stats.maxSeconds)
+                total.buckets = [a + b for a, b in zip(total.buckets, stats.buckets)]
+                total.bytesSent += stats.bytesSent
+                total.bytesReceived += stats.bytesReceived
+                total.tookMs += stats.tookMs
+                total.tookCount += stats.tookCount
+                total.retries += stats.retries
+                for status, count in stats.statuses.items():
+                    total.statuses[status] = total.statuses.get(status, 0) + count
+            content = {
+                "script": self.script,
+                "started": self.started,
+                "finished": time.time(),
+                "endpoints": [dict(method=method, endpoint=endpoint, **stats.summary()) for (method, endpoint), stats in endpoints],
+                "total": total.summary()
+            }
+        return content
+
+    def toJson(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def toPrometheus(self):
+        content = self.summary()
+        script = escapeLabel(content["script"])
+        lines = []
+
+        def metric(name, metricType, help, samples):
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, metricType))
+            lines.extend(samples)
+
+        labels = ['script="%s",method="%s",endpoint="%s"' % (script, escapeLabel(entry["method"]), escapeLabel(entry["endpoint"])) for entry in content["endpoints"]]
+        histogram = []
+        for label, entry in zip(labels, content["endpoints"]):
+            cumulative = 0
+            for bound, count in entry["buckets"].items():
+                cumulative += count
+                histogram.append('elastic_api_request_duration_seconds_bucket{%s,le="%s"} %s' % (label, bound, cumulative))
+            histogram.append("elastic_api_request_duration_seconds_sum{%s} %s" % (label, repr(entry["seconds"]["sum"])))
+            histogram.append("elastic_api_request_duration_seconds_count{%s} %s" % (label, entry["count"]))
+        metric("elastic_api_request_duration_seconds", "histogram", "Wall time of the requests to the cluster, retries included", histogram)
+        metric("elastic_api_requests_total", "counter", "Requests to the cluster by status code, error on connection errors",
+               ['elastic_api_requests_total{%s,status="%s"} %s' % (label, status, count) for label, entry in zip(labels, content["endpoints"]) for status, count in sorted(entry["statuses"].items())])
+        metric("elastic_api_request_bytes_total", "counter", "Bytes of the request bodies",
+               ["elastic_api_request_bytes_total{%s} %s" % (label, entry["bytesSent"]) for label, entry in zip(labels, content["endpoints"])])
+        metric("elastic_api_response_bytes_total", "counter", "Bytes of the response bodies",
+               ["elastic_api_response_bytes_total{%s} %s" % (label, entry["bytesReceived"]) for label, entry in zip(labels, content["endpoints"])])
+        metric("elastic_api_took_seconds_total", "counter", "Time reported by the cluster in the took field of the responses",
+               ["elastic_api_took_seconds_total{%s} %s" % (label, repr(entry["tookMs"] / 1000.0)) for label, entry in zip(labels, content["endpoints"])])
+        metric("elastic_api_retries_total", "counter", "Retries of the requests on error statuses, connection errors and endpoint failovers",
+               ["elastic_api_retries_total{%s} %s" % (label, entry["retries"]) for label, entry in zip(labels, content["endpoints"])])
+        metric("elastic_api_last_run_timestamp_seconds", "gauge", "End of the last run of the script",
+               ['elastic_api_last_run_timestamp_seconds{script="%s"} %s' % (script, repr(content["finished"]))])
+        return "\n".join(lines) + "\n"
+
+    def printSummary(self):
+        content = self.summary()
+        print("%-7s %-45s %7s %6s %9s %9s %9s %11s %11s %7s" % ("Method", "Endpoint", "Count", "Errors", "p50 ms", "p99 ms", "took ms", "Sent", "Received", "Retries"))
+        for entry in content["endpoints"] + [dict(method="", endpoint="Total", **content["total"])]:
+            print("%-7s %-45s %7s %6s %9.1f %9.1f %9s %11s %11s %7s" % (entry["method"], entry["endpoint"], entry["count"], entry["errors"], entry["seconds"]["p50"] * 1000,
+                                                                         entry["seconds"]["p99"] * 1000, entry["tookMs"], entry["bytesSent"], entry["bytesReceived"], entry["retries"]))
+
+    # Write the metrics to a file, in Prometheus format for .prom files and JSON otherwise. The file is replaced at
+    # once so the textfile collector never reads it half written
+    def export(self, path):
+        if path == "-":
+            self.printSummary()
+            return
+        data = self.toPrometheus() if path.endswith(".prom") else self.toJson()
+        temporary = "%s.%s.tmp" % (path, os.getpid())
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+
+requestMetrics = RequestMetrics()
+
+
+def exportRequestMetrics():
+    path = os.environ.get("ELASTIC_API_METRICS")
+    if not path or not requestMetrics.endpoints:
+        return
+    try:
+        requestMetrics.export(path)
+    except Exception as e:
+        print("ERROR: Could not export the request metrics to %s: %s" % (path, e))
+
+
+atexit.register(exportRequestMetrics)
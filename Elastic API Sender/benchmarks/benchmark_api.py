@@ -0,0 +1,279 @@
+__version__ = '2021.10.05'
+
+import os
+import sys
+import json
+import time
+import runpy
+import getpass
+import argparse
+import tempfile
+import traceback
+import contextlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+benchmarksDir = os.path.dirname(os.path.abspath(__file__))
+scriptsDir = os.path.dirname(benchmarksDir)
+sys.path.insert(0, scriptsDir)
+from api import *
+from api_metrics import requestMetrics
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Throughput of API, create_monitors.py and export_mysql_errors.py against the local stand-in of mock_server.py
+# (or any cluster given with --url). Every scenario runs in its own process so its peak RSS is its own, and reports
+# requests/s and the p50/p99 latency of the requests seen by API.request, retries included.
+#   python3 benchmark_api.py --docs 200000 --hosts 1000 --latency 2 --error-rate 0.01 -o results.json
+
+scenarioNames = ["health", "search", "search_after", "sliced", "settings", "create_monitors", "create_monitors_async", "sync_monitors", "export_stream", "export_sliced", "export_summary"]
+
+
+# Latency and status of every request sent through API and AsyncAPI, taken from the request metrics hooks
+# (api_metrics.py) so the benchmark times the requests exactly as the scripts report them
+class RequestRecorder(object):
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.enabled = True
+
+    def requestFinished(self, event):
+        if not self.enabled:
+            return
+        self.latencies.append(event["seconds"])
+        if event["status"] is None or event["status"] >= 400:
+            self.errors += 1
+
+    def install(self):
+        requestMetrics.addHook(self)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+# Peak resident memory of this process in MB
+def peakRss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1048576 if sys.platform == "darwin" else peak / 1024
+
+
+def newAPI(url, args):
+    api = API()
+    api.endpoints = [url]
+    api.session.auth = ("benchmark", "benchmark")
+    api.configureSession(poolMaxsize=max(10, args.workers), retries=3, backoffFactor=args.backoff)
+    if not api.getValidEndpoint():
+        raise RuntimeError("No valid endpoint at %s" % url)
+    return api
+
+
+# The scripts ship with an empty endpoints list and ask for the password: point them to the benchmarked server
+def patchScripts(url):
+    getpass.getpass = lambda prompt="": "benchmark"
+    originalGetValidEndpoint = API.getValidEndpoint
+
+    def getValidEndpoint(self):
+        self.endpoints = [url]
+        return originalGetValidEndpoint(self)
+
+    API.getValidEndpoint = getValidEndpoint
+
+
+def runScript(name, arguments):
+    argv = sys.argv
+    sys.argv = [name] + arguments
+    try:
+        runpy.run_path(os.path.join(scriptsDir, name), run_name="__main__")
+    finally:
+        sys.argv = argv
+
+
+def writeHostnames(directory, hosts):
+    path = os.path.join(directory, "hostnames.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(hosts):
+            f.write("srv-bench-%05d\n" % i)
+    return path
+
+
+def runScenario(name, url, args, recorder):
+    with tempfile.TemporaryDirectory() as directory:
+        if name == "health":
+            api = newAPI(url, args)
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                list(executor.map(lambda i: api.get(api.validEndpoint + "_cluster/health"), range(args.requests)))
+        elif name == "search":
+            api = newAPI(url, args)
+            for i in range(args.searches):
+                api.search("filebeat-*", {"size": 10000, "query": {"match_all": {}}, "sort": [{"@timestamp": {"order": "desc"}}]})
+        elif name == "search_after":
+            api = newAPI(url, args)
+            for hits in api.searchAfter("filebeat-*", {"query": {"match_all": {}}}, pageSize=args.page_size):
+                pass
+        elif name == "sliced":
+            api = newAPI(url, args)
+            for hits in api.slicedSearch("filebeat-*", {"query": {"match_all": {}}}, slices=args.slices, pageSize=args.page_size):
+                pass
+        elif name == "settings":
+            api = newAPI(url, args)
+            for i in range(args.requests // 2):
+                api.putIndexSettings("filebeat-*", {"index": {"refresh_interval": "%ss" % (i % 60 + 1)}}, ignoreUnavailable=True)
+                api.getIndexSettings("filebeat-*", ["index.refresh_interval"], ignoreUnavailable=True)
+        elif name in ("create_monitors", "create_monitors_async", "sync_monitors"):
+            csvFile = writeHostnames(directory, args.hosts)
+            arguments = ["-u", "benchmark", "-f", csvFile, "-w", str(args.workers)]
+            if name == "create_monitors_async":
+                arguments.append("-a")
+            if name == "sync_monitors":
+                # Create the monitors first, then time a sync finding every monitor up to date
+                recorder.enabled = False
+                runScript("create_monitors.py", arguments)
+                recorder.enabled = True
+                arguments = arguments + ["-s"]
+            runScript("create_monitors.py", arguments)
+        elif name in ("export_stream", "export_sliced", "export_summary"):
+            arguments = ["-u", "benchmark", "-o", os.path.join(directory, "export.csv"), "--page-size", str(args.page_size)]
+            if name == "export_stream":
+                arguments.append("-s")
+            elif name == "export_sliced":
+                arguments += ["--slices", str(args.slices)]
+            else:
+                arguments += ["--summary", "--samples", "3"]
+            runScript("export_mysql_errors.py", arguments)
+        else:
+            raise ValueError("Unknown scenario %s" % name)
+
+
+# Run one scenario in this process and print its result as JSON on the last line
+def runChild(args):
+    recorder = RequestRecorder()
+    recorder.install()
+    patchScripts(args.url)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        runScenario(args.scenario, args.url, args, recorder)
+    elapsed = time.perf_counter() - start
+    latencies = sorted(recorder.latencies)
+    print(json.dumps({
+        "scenario": args.scenario,
+        "requests": len(latencies),
+        "errors": recorder.errors,
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed else 0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_rss_mb": peakRss()
+    }))
+
+
+def startMockServer(args):
+    command = [sys.executable, os.path.join(benchmarksDir, "mock_server.py"), "--port", "0", "--docs", str(args.docs),
+               "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate), "--seed", "1"]
+    if args.retry_after:
+        command += ["--retry-after", args.retry_after]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+    line = process.stdout.readline()
+    if not line.startswith("Listening on "):
+        process.kill()
+        raise RuntimeError("The mock server did not start: %s" % line)
+    return process, line.split()[-1]
+
+
+def childArguments(args, scenario, url):
+    return [sys.executable, os.path.abspath(__file__), "--scenario", scenario, "--url", url, "--workers", str(args.workers),
+            "--requests", str(args.requests), "--searches", str(args.searches), "--page-size", str(args.page_size),
+            "--slices", str(args.slices), "--hosts", str(args.hosts), "--backoff", str(args.backoff)]
+
+
+def main():
+    # Get and check arguments
+    parser = argparse.ArgumentParser(description="Measure requests/s, latency and peak RSS of API and the scripts against a local stand-in cluster.", formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-v', '--version', action='version', version=__version__)
+    parser.add_argument('-s', '--scenarios', action='store', default=",".join(scenarioNames), help='Comma separated scenarios (default: all)\n%s' % ", ".join(scenarioNames))
+    parser.add_argument('--url', action='store', help='Benchmark this server instead of starting mock_server.py')
+    parser.add_argument('-d', '--docs', action='store', type=int, default=100000, help='Documents of the stand-in server (default: 100000)')
+    parser.add_argument('-l', '--latency', action='store', type=float, default=0, help='Latency of the stand-in server in ms (default: 0)')
+    parser.add_argument('-j', '--jitter', action='store', type=float, default=0, help='Random latency of the stand-in server in ms (default: 0)')
+    parser.add_argument('-e', '--error-rate', action='store', type=float, default=0, help='Fraction of requests answered with HTTP 503 by the stand-in server (default: 0)')
+    parser.add_argument('--retry-after', action='store', help='Retry-After header of the injected errors, in seconds')
+    parser.add_argument('-w', '--workers', action='store', type=int, default=8, help='Concurrent requests of the health scenario and the monitor scripts (default: 8)')
+    parser.add_argument('-n', '--requests', action='store', type=int, default=2000, help='Requests of the health and settings scenarios (default: 2000)')
+    parser.add_argument('--searches', action='store', type=int, default=10, help='10000 hits searches of the search scenario (default: 10)')
+    parser.add_argument('--page-size', action='store', type=int, default=1000, help='Hits per page of the exports (default: 1000)')
+    parser.add_argument('--slices', action='store', type=int, default=4, help='Slices of the sliced exports (default: 4)')
+    parser.add_argument('--hosts', action='store', type=int, default=500, help='Hostnames of the monitor scenarios (default: 500)')
+    parser.add_argument('--backoff', action='store', type=float, default=0.05, help='Backoff factor of the retries in seconds (default: 0.05)')
+    parser.add_argument('-o', '--output', action='store', help='Save the results to this JSON file')
+    parser.add_argument('--scenario', action='store', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        runChild(args)
+        return
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    for name in scenarios:
+        if name not in scenarioNames:
+            print("ERROR: Unknown scenario %s, available scenarios: %s" % (name, ", ".join(scenarioNames)))
+            sys.exit(1)
+
+    server = None
+    url = args.url
+    if not url:
+        server, url = startMockServer(args)
+        print("Mock server at %s with %s documents, %.1f ms latency, %.1f%% errors" % (url, args.docs, args.latency, args.error_rate * 100))
+    results = []
+    failed = False
+    try:
+        print("%-22s %9s %7s %9s %10s %9s %9s %10s" % ("Scenario", "Requests", "Errors", "Seconds", "Req/s", "p50 ms", "p99 ms", "Peak RSS"))
+        for name in scenarios:
+            if name == "create_monitors_async":
+                try:
+                    import aiohttp
+                except ImportError:
+                    print("%-22s skipped, aiohttp is not installed" % name)
+                    continue
+            child = subprocess.run(childArguments(args, name, url), stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+            lines = child.stdout.strip().splitlines()
+            if child.returncode != 0 or not lines:
+                print("%-22s failed: %s" % (name, (child.stderr or child.stdout).strip().splitlines()[-1:]))
+                failed = True
+                continue
+            result = json.loads(lines[-1])
+            results.append(result)
+            peak = "%8.1f MB" % result["peak_rss_mb"] if result["peak_rss_mb"] is not None else "%10s" % "-"
+            print("%-22s %9d %7d %9.2f %10.1f %9.2f %9.2f %s" % (name, result["requests"], result["errors"], result["seconds"], result["requests_per_second"], result["p50_ms"], result["p99_ms"], peak))
+        if server:
+            stats = requests.get(url + "_mock/stats").json()
+            print("Mock server: %s errors injected, %s monitors, %s open PITs, %s open scrolls" % (stats["counters"].get("injected_errors", 0), stats["monitors"], stats["pits"], stats["scrolls"]))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"version": __version__, "docs": args.docs, "latency_ms": args.latency, "error_rate": args.error_rate, "workers": args.workers, "results": results}, f, indent=2)
+        print("Results saved to %s" % args.output)
+    if failed:
+        sys.exit(1)
+
+
+# Call main/start program and catch exceptions
+try:
+    main()
+except SystemExit:
+    raise
+except:
+    print("Exception occurred:")
+    print(traceback.format_exc())
+    sys.exit(1)
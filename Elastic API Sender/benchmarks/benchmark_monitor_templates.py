@@ -0,0 +1,62 @@
+__version__ = '2021.10.05'
+
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from monitor_templates import *
+
+# Same settings as create_monitors.py
+templateVariables = {
+    "storage_percentage": "80",
+    "storage_critical_percentage": "90",
+    "storage_monitor_time": 30,
+    "storage_monitor_time_units": "MINUTES",
+    "ram_percentage": "90",
+    "ram_monitor_time": 10,
+    "ram_monitor_units": "MINUTES",
+    "cpu_percentage": "90",
+    "cpu_monitor_time": 10,
+    "cpu_monitor_units": "MINUTES"
+}
+destinations = [("EnvioAlertaITS", "destination1"), ("EnvioAlertaSupportCPD", "destination2")]
+templatesDir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "monitor_templates")
+
+
+def main():
+    # Get and check arguments
+    parser = argparse.ArgumentParser(description="Measure the time needed to build monitor payloads from the templates.", formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-v', '--version', action='version', version=__version__)
+    parser.add_argument('-n', '--hosts', action='store', type=int, default=10000, help='Number of hostnames to stamp (default: 10000)')
+    parser.add_argument('-m', '--monitors', action='store', default="storage,ram,cpu", help='Comma separated monitor templates (default: storage,ram,cpu)')
+    parser.add_argument('-s', '--serialize', action='store_true', help='Also serialize every payload to JSON as it would be sent')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    templates = loadTemplates(templatesDir, templateVariables, destinations, args.monitors.split(","))
+    print("Loaded and compiled %s templates in %.2f ms" % (len(templates), (time.perf_counter() - start) * 1000))
+
+    hostnames = ["srv-bench-%05d" % i for i in range(args.hosts)]
+    for template in templates:
+        start = time.perf_counter()
+        for hostname in hostnames:
+            payload = template.stampHost(hostname)
+            if args.serialize:
+                json.dumps(payload)
+        elapsed = time.perf_counter() - start
+        print("%-15s %d payloads in %8.2f ms (%.2f us/payload)" % (template.name, args.hosts, elapsed * 1000, elapsed * 1000000 / args.hosts))
+
+
+# Call main/start program and catch exceptions
+try:
+    main()
+except SystemExit:
+    pass
+except:
+    print("Exception occurred:")
+    print(traceback.format_exc())
+    sys.exit(1)
@@ -0,0 +1,551 @@
+__version__ = '2021.10.05'
+
+import os
+import sys
+import json
+import gzip
+import time
+import random
+import fnmatch
+import argparse
+import threading
+import traceback
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from index_profiles import flattenSettings
+
+# Local stand-in of the Elasticsearch/OpenDistro endpoints used by the scripts, to benchmark and regression test them
+# without a cluster: _cluster/health, _search with PIT/search_after and sliced scrolls, _settings, _resolve/index,
+# _cat/indices, _stats/indexing, _template, _opendistro/_alerting/monitors and composite aggregations (terms and
+# date_histogram sources, top_hits sub aggregation, time zones ignored). The documents are generated from
+# their position, so any dataset size costs no memory. Latency and error injection are configurable. With
+# --distribution opensearch the cluster answers as OpenSearch 1.3, storing the triggers of the monitors wrapped by type.
+#   python3 mock_server.py --port 9200 --docs 100000 --latency 5 --error-rate 0.01
+
+maxResultWindow = 10000
+logLevels = ["Warning", "Error", "Note", "System"]
+# Settings of every index when they are not set explicitly
+indexDefaults = {
+    "index.number_of_shards": "1",
+    "index.number_of_replicas": "1",
+    "index.refresh_interval": "1s",
+    "index.translog.durability": "request"
+}
+
+
+def nestSettings(flat):
+    nested = {}
+    for key, value in flat.items():
+        node = nested
+        parts = key.split(".")
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return nested
+
+
+# Path with the index names and IDs replaced, e.g. /{name}/_search, to count the requests per endpoint
+def endpointName(path):
+    return "/" + "/".join(part if part.startswith("_") or part in ("health", "scroll", "point_in_time", "monitors", "index", "indices", "stats") else "{name}" for part in path.split("/") if part)
+
+
+intervalUnits = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def intervalSeconds(interval):
+    number = interval.rstrip("smhd")
+    return float(number or 1) * intervalUnits[interval[len(number):]]
+
+
+# Date format of the date_histogram sources, e.g. yyyy-MM-dd HH:mm, to strftime
+def strftimeFormat(format):
+    for token, directive in (("yyyy", "%Y"), ("MM", "%m"), ("dd", "%d"), ("HH", "%H"), ("mm", "%M"), ("ss", "%S")):
+        format = format.replace(token, directive)
+    return format
+
+
+def fieldValue(source, field):
+    for part in field.split("."):
+        if not isinstance(source, dict) or part not in source:
+            return None
+        source = source[part]
+    return source
+
+
+def errorBody(status, errorType, reason):
+    return {"error": {"root_cause": [{"type": errorType, "reason": reason}], "type": errorType, "reason": reason}, "status": status}
+
+
+class MockCluster(object):
+
+    def __init__(self, docs=100000, days=30, monitors=0, ingestRate=1000, distribution="opendistro"):
+        self.docs = docs
+        self.distribution = distribution
+        self.lock = threading.Lock()
+        self.startTime = time.monotonic()
+        self.ingestRate = ingestRate
+        # Fixed origin so the dataset is the same on every run, one document per second going back in time
+        self.origin = datetime(2026, 10, 18, 12, 0, 0)
+        self.originMillis = int((self.origin - datetime(1970, 1, 1)).total_seconds() * 1000)
+        self.indices = {}
+        for day in range(days):
+            suffix = (self.origin - timedelta(days=day)).strftime("%Y.%m.%d")
+            for family in ("filebeat-7.10.2-", "metricbeat-7.10.2-", "wazuh-alerts-4.x-", "wazuh-monitoring-"):
+                self.indices[family + suffix] = {}
+        self.templates = {}
+        self.monitors = {}
+        self.monitorSequence = 0
+        for i in range(monitors):
+            self.addMonitor({"type": "monitor", "name": "[srv-preload-%05d] Storage" % i, "enabled": True})
+        self.pitSequence = 0
+        self.pits = set()
+        self.scrollSequence = 0
+        self.scrolls = {}
+        self.compositeCache = {}
+        self.counters = {}
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def addMonitor(self, monitor):
+        self.monitorSequence += 1
+        monitorId = "mon-%08d" % self.monitorSequence
+        self.monitors[monitorId] = self.storedMonitor(monitor)
+        return monitorId
+
+    # OpenSearch Alerting 1.1+ stores and returns every trigger wrapped by type, Open Distro stores them as sent
+    def storedMonitor(self, monitor):
+        if self.distribution != "opensearch" or not isinstance(monitor.get("triggers"), list):
+            return monitor
+        triggerType = "bucket_level_trigger" if monitor.get("monitor_type") == "bucket_level_monitor" else "query_level_trigger"
+        triggers = [trigger if isinstance(trigger, dict) and triggerType in trigger else {triggerType: trigger} for trigger in monitor["triggers"]]
+        return dict(monitor, triggers=triggers)
+
+    def rootInfo(self):
+        if self.distribution == "opensearch":
+            version = {"number": "1.3.0", "distribution": "opensearch"}
+        else:
+            version = {"number": "7.10.2", "distribution": "opendistroforelasticsearch"}
+        return {"name": "mock", "cluster_name": "mock-cluster", "version": version, "tagline": "You Know, for Search"}
+
+    def hit(self, i):
+        timestamp = self.originMillis - i * 1000
+        when = self.origin - timedelta(seconds=i)
+        docId = "doc-%09d" % i
+        return {
+            "_index": "filebeat-7.10.2-" + when.strftime("%Y.%m.%d"),
+            "_id": docId,
+            "_score": None,
+            "_source": {
+                "@timestamp": when.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "agent": {"hostname": "SRVPN-LBBDD-%02d" % (i % 20)},
+                "log": {"level": logLevels[i % len(logLevels)]},
+                "event": {"module": "mysql", "dataset": "mysql.error"},
+                "message": "[MY-%06d] [Server] Aborted connection %d to db: 'wazuh' (Got an error reading communication packets)" % (i % 13000, i)
+            },
+            "sort": [timestamp, docId]
+        }
+
+    def matchIndices(self, target):
+        names = []
+        for pattern in unquote(target).split(","):
+            if pattern in ("_all", "*", ""):
+                names.extend(self.indices)
+            else:
+                names.extend(name for name in self.indices if fnmatch.fnmatchcase(name, pattern))
+        return sorted(set(names))
+
+    def searchResponse(self, hits, total, extra=None):
+        content = {
+            "took": 1,
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {"total": {"value": min(total, maxResultWindow), "relation": "eq" if total <= maxResultWindow else "gte"}, "max_score": None, "hits": hits}
+        }
+        if extra:
+            content.update(extra)
+        return content
+
+    def sourceValue(self, source, i, document):
+        sourceType, spec = next(iter(source.items()))
+        if sourceType == "date_histogram":
+            seconds = intervalSeconds(spec.get("fixed_interval") or spec.get("calendar_interval") or spec["interval"])
+            timestamp = self.originMillis - i * 1000
+            timestamp -= timestamp % int(seconds * 1000)
+            if "format" in spec:
+                return (datetime(1970, 1, 1) + timedelta(milliseconds=timestamp)).strftime(strftimeFormat(spec["format"]))
+            return timestamp
+        return fieldValue(document, spec["field"])
+
+    # Every bucket of a composite aggregation sorted by key, with the documents of its top_hits. Computed once per
+    # aggregation, the pages are served from the cache
+    def compositeBuckets(self, composite, samples):
+        cacheKey = json.dumps([composite["sources"], samples], sort_keys=True)
+        with self.lock:
+            cached = self.compositeCache.get(cacheKey)
+        if cached is not None:
+            return cached
+        sources = [next(iter(source.values())) for source in composite["sources"]]
+        missingBuckets = [next(iter(source.values())).get("missing_bucket", False) for source in sources]
+        buckets = {}
+        for i in range(self.docs):
+            document = self.hit(i)["_source"]
+            key = tuple(self.sourceValue(source, i, document) for source in sources)
+            if any(value is None and not missingBuckets[position] for position, value in enumerate(key)):
+                continue
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [0, []]
+            bucket[0] += 1
+            if len(bucket[1]) < samples:
+                bucket[1].append(i)
+        # Missing values first, then ascending
+        ordered = sorted(buckets.items(), key=lambda item: [(value is not None, value if value is not None else 0) for value in item[0]])
+        with self.lock:
+            self.compositeCache[cacheKey] = ordered
+        return ordered
+
+    def composite(self, aggregation):
+        composite = aggregation["composite"]
+        names = [next(iter(source)) for source in composite["sources"]]
+        subAggregations = aggregation.get("aggs", aggregation.get("aggregations", {}))
+        topHits = {name: spec["top_hits"] for name, spec in subAggregations.items() if "top_hits" in spec}
+        samples = max([spec.get("size", 3) for spec in topHits.values()] or [0])
+        ordered = self.compositeBuckets(composite, samples)
+        start = 0
+        if "after" in composite:
+            after = [(composite["after"][name] is not None, composite["after"][name] if composite["after"][name] is not None else 0) for name in names]
+            while start < len(ordered) and [(value is not None, value if value is not None else 0) for value in ordered[start][0]] <= after:
+                start += 1
+        page = []
+        for key, (count, documents) in ordered[start:start + composite.get("size", 10)]:
+            bucket = {"key": dict(zip(names, key)), "doc_count": count}
+            for name, spec in topHits.items():
+                includes = spec.get("_source")
+                hits = []
+                for i in documents[:spec.get("size", 3)]:
+                    hit = self.hit(i)
+                    if isinstance(includes, list):
+                        hit["_source"] = {field: fieldValue(hit["_source"], field) for field in includes}
+                    hits.append(hit)
+                bucket[name] = {"hits": {"total": {"value": count, "relation": "eq"}, "max_score": None, "hits": hits}}
+            page.append(bucket)
+        content = {"buckets": page}
+        if page:
+            content["after_key"] = page[-1]["key"]
+        return content
+
+    # Plain searches and search_after pages over the documents, with or without a point in time
+    def search(self, body, query):
+        for name, aggregation in (body.get("aggs") or body.get("aggregations") or {}).items():
+            if "composite" in aggregation:
+                return 200, self.searchResponse([], self.docs, {"aggregations": {name: self.composite(aggregation)}})
+        size = body.get("size", 10)
+        start = body.get("from", 0)
+        searchAfter = body.get("search_after")
+        if searchAfter:
+            # The tiebreaker is the _shard_doc position with a point in time, the _id otherwise
+            last = searchAfter[-1]
+            start = (last if isinstance(last, int) else int(str(last).rsplit("-", 1)[1])) + 1
+        elif start + size > maxResultWindow:
+            return 400, errorBody(400, "illegal_argument_exception", "Result window is too large, from + size must be less than or equal to: [%s]" % maxResultWindow)
+        if "scroll" in query:
+            return self.openScroll(body, query["scroll"][0])
+        hits = [self.hit(i) for i in range(start, min(start + size, self.docs))]
+        extra = None
+        if "pit" in body:
+            if body["pit"]["id"] not in self.pits:
+                return 404, errorBody(404, "search_context_missing_exception", "No search context found for id [%s]" % body["pit"]["id"])
+            extra = {"pit_id": body["pit"]["id"]}
+            for i, hit in enumerate(hits, start):
+                hit["sort"] = [hit["sort"][0], i]
+        return 200, self.searchResponse(hits, self.docs, extra)
+
+    def openScroll(self, body, keepAlive):
+        sliceSpec = body.get("slice", {"id": 0, "max": 1})
+        with self.lock:
+            self.scrollSequence += 1
+            scrollId = "scroll-%08d" % self.scrollSequence
+            self.scrolls[scrollId] = [sliceSpec["id"], sliceSpec["max"], 0, body.get("size", 10)]
+        return self.scrollPage(scrollId)
+
+    def scrollPage(self, scrollId):
+        with self.lock:
+            state = self.scrolls.get(scrollId)
+            if state is None:
+                return 404, errorBody(404, "search_context_missing_exception", "No search context found for id [%s]" % scrollId)
+            sliceId, sliceMax, position, size = state
+            state[2] += size
+        hits = []
+        for ordinal in range(position, position + size):
+            i = ordinal * sliceMax + sliceId
+            if i >= self.docs:
+                break
+            hits.append(self.hit(i))
+        total = len(range(sliceId, self.docs, sliceMax))
+        return 200, self.searchResponse(hits, total, {"_scroll_id": scrollId})
+
+    def searchMonitors(self, body):
+        size = body.get("size", 10)
+        with self.lock:
+            ids = sorted(self.monitors)
+            if body.get("search_after"):
+                ids = [monitorId for monitorId in ids if monitorId > body["search_after"][0]]
+            hits = [{"_index": ".opendistro-alerting-config", "_id": monitorId, "_score": None, "_source": {"monitor": self.monitors[monitorId]}, "sort": [monitorId]} for monitorId in ids[:size]]
+            total = len(self.monitors)
+        return 200, self.searchResponse(hits, total)
+
+    def getSettings(self, target, names, query):
+        indices = self.matchIndices(target)
+        flat = query.get("flat_settings", ["false"])[0] == "true"
+        includeDefaults = query.get("include_defaults", ["false"])[0] == "true"
+        patterns = names.split(",") if names else ["*"]
+        content = {}
+        with self.lock:
+            for index in indices:
+                explicit = {key: value for key, value in self.indices[index].items() if any(fnmatch.fnmatchcase(key, pattern) for pattern in patterns)}
+                entry = {"settings": explicit if flat else nestSettings(explicit)}
+                if includeDefaults:
+                    defaults = {key: value for key, value in indexDefaults.items() if key not in explicit and any(fnmatch.fnmatchcase(key, pattern) for pattern in patterns)}
+                    entry["defaults"] = defaults if flat else nestSettings(defaults)
+                content[index] = entry
+        return 200, content
+
+    def putSettings(self, target, body, query):
+        indices = self.matchIndices(target)
+        if not indices and query.get("allow_no_indices", ["false"])[0] != "true":
+            return 404, errorBody(404, "index_not_found_exception", "no such index [%s]" % target)
+        settings = flattenSettings(body.get("settings", body))
+        settings = {(key if key.startswith("index.") else "index." + key): value for key, value in settings.items()}
+        with self.lock:
+            for index in indices:
+                for key, value in settings.items():
+                    if value is None:
+                        self.indices[index].pop(key, None)
+                    else:
+                        self.indices[index][key] = str(value)
+        return 200, {"acknowledged": True}
+
+    # Every index receives ingestRate documents per second since the server started
+    def indexingStats(self, target):
+        indices = self.matchIndices(target)
+        total = int((time.monotonic() - self.startTime) * self.ingestRate)
+        perIndex = {index: {"primaries": {"indexing": {"index_total": total}}} for index in indices}
+        return 200, {"_all": {"primaries": {"indexing": {"index_total": total * len(indices)}}}, "indices": perIndex}
+
+    # Answer a request: returns (HTTP status, JSON content)
+    def route(self, method, path, query, body):
+        parts = [part for part in path.split("/") if part]
+        if not parts:
+            return 200, self.rootInfo()
+        if parts[0] == "_cluster" and parts[1:] == ["health"]:
+            return 200, {"cluster_name": "mock-cluster", "status": "green", "number_of_nodes": 1, "active_shards_percent_as_number": 100.0}
+        if parts[0] == "_mock" and parts[1:] == ["stats"]:
+            with self.lock:
+                return 200, {"counters": dict(self.counters), "monitors": len(self.monitors), "pits": len(self.pits), "scrolls": len(self.scrolls)}
+        if parts[0] == "_opendistro" and parts[1:3] == ["_alerting", "monitors"]:
+            rest = parts[3:]
+            if method == "POST" and rest == ["_search"]:
+                return self.searchMonitors(body)
+            if method == "POST" and not rest:
+                with self.lock:
+                    monitorId = self.addMonitor(body)
+                return 201, {"_id": monitorId, "_version": 1, "_seq_no": 0, "_primary_term": 1, "monitor": self.monitors[monitorId]}
+            if len(rest) == 1:
+                with self.lock:
+                    if rest[0] not in self.monitors:
+                        return 404, errorBody(404, "status_exception", "Monitor not found.")
+                    if method == "PUT":
+                        self.monitors[rest[0]] = self.storedMonitor(body)
+                        return 200, {"_id": rest[0], "_version": 2, "_seq_no": 1, "_primary_term": 1, "monitor": self.monitors[rest[0]]}
+                    if method == "DELETE":
+                        del self.monitors[rest[0]]
+                        return 200, {"_id": rest[0], "result": "deleted"}
+                    if method == "GET":
+                        return 200, {"_id": rest[0], "monitor": self.monitors[rest[0]]}
+        if parts[0] == "_search" and parts[1:] == ["scroll"]:
+            if method == "DELETE":
+                with self.lock:
+                    for scrollId in body.get("scroll_id", []) if body else []:
+                        self.scrolls.pop(scrollId, None)
+                return 200, {"succeeded": True, "num_freed": 1}
+            return self.scrollPage(body["scroll_id"])
+        if parts[0] in ("_pit",) or parts[0:2] == ["_search", "point_in_time"]:
+            with self.lock:
+                pitIds = body.get("id", body.get("pit_id", [])) if body else []
+                for pitId in pitIds if isinstance(pitIds, list) else [pitIds]:
+                    self.pits.discard(pitId)
+            return 200, {"succeeded": True, "num_freed": 1}
+        if parts[0] == "_search":
+            return self.search(body or {}, query)
+        if parts[0] == "_resolve" and len(parts) == 3:
+            return 200, {"indices": [{"name": index, "attributes": ["open"]} for index in self.matchIndices(parts[2])], "aliases": [], "data_streams": []}
+        if parts[0] == "_cat" and len(parts) >= 2 and parts[1] == "indices":
+            return 200, [{"index": index} for index in self.matchIndices(parts[2] if len(parts) > 2 else "*")]
+        if parts[0] == "_template" and len(parts) == 2:
+            with self.lock:
+                if method == "PUT":
+                    self.templates[parts[1]] = body
+                    return 200, {"acknowledged": True}
+                if parts[1] in self.templates:
+                    return 200, {parts[1]: self.templates[parts[1]]}
+            return 404, {}
+        # Index level endpoints: <target>/_search, _pit, _settings, _stats
+        if len(parts) >= 2:
+            target, action = parts[0], parts[1]
+            if action == "_search" and parts[2:] == ["point_in_time"] or action == "_pit":
+                with self.lock:
+                    self.pitSequence += 1
+                    pitId = "pit-%08d" % self.pitSequence
+                    self.pits.add(pitId)
+                return 200, {"id": pitId} if action == "_pit" else {"pit_id": pitId}
+            if action == "_search":
+                return self.search(body or {}, query)
+            if action == "_settings":
+                if method == "PUT":
+                    return self.putSettings(target, body or {}, query)
+                return self.getSettings(target, parts[2] if len(parts) > 2 else None, query)
+            if action == "_stats":
+                return self.indexingStats(target)
+        return 400, errorBody(400, "illegal_argument_exception", "no handler found for uri [%s] and method [%s]" % (path, method))
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "mock-elasticsearch"
+    # Headers and body are written separately, with Nagle the body would wait for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def handle_one_request(self):
+        try:
+            BaseHTTPRequestHandler.handle_one_request(self)
+        except ConnectionError:
+            self.close_connection = True
+
+    def readBody(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        return json.loads(data) if data else None
+
+    def reply(self, status, content, headers=None):
+        data = json.dumps(content).encode("utf-8")
+        if self.command == "HEAD":
+            data = b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def dispatch(self):
+        server = self.server
+        url = urlsplit(self.path)
+        body = self.readBody()
+        if server.latency or server.jitter:
+            time.sleep((server.latency + random.uniform(0, server.jitter)) / 1000)
+        # The health checks and the server stats are left out of the error injection so the clients can still find
+        # the endpoint
+        if server.errorRate and url.path.rstrip("/") not in ("", "/_cluster/health", "/_mock/stats") and random.random() < server.errorRate:
+            server.cluster.count("injected_errors")
+            headers = {"Retry-After": server.retryAfter} if server.retryAfter else None
+            self.reply(server.errorStatus, errorBody(server.errorStatus, "mock_injected_exception", "Injected error"), headers)
+            return
+        server.cluster.count(self.command + " " + endpointName(url.path))
+        try:
+            status, content = server.cluster.route(self.command, url.path, parse_qs(url.query), body)
+        except Exception as e:
+            status, content = 500, errorBody(500, "mock_exception", "%s: %s" % (e.__class__.__name__, e))
+        self.reply(status, content)
+
+    do_GET = dispatch
+    do_HEAD = dispatch
+    do_POST = dispatch
+    do_PUT = dispatch
+    do_DELETE = dispatch
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, cluster, latency=0, jitter=0, errorRate=0, errorStatus=503, retryAfter=None, verbose=False):
+        ThreadingHTTPServer.__init__(self, address, MockHandler)
+        self.cluster = cluster
+        self.latency = latency
+        self.jitter = jitter
+        self.errorRate = errorRate
+        self.errorStatus = errorStatus
+        self.retryAfter = retryAfter
+        self.verbose = verbose
+
+    @property
+    def url(self):
+        return "http://%s:%s/" % self.server_address[:2]
+
+    # Serve on a background thread, for in process use
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    # Get and check arguments
+    parser = argparse.ArgumentParser(description="Local Elasticsearch/OpenDistro stand-in to benchmark the scripts without a cluster.", formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-v', '--version', action='version', version=__version__)
+    parser.add_argument('--host', action='store', default="127.0.0.1", help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('-p', '--port', action='store', type=int, default=9200, help='Port to listen on, 0 for any free port (default: 9200)')
+    parser.add_argument('-d', '--docs', action='store', type=int, default=100000, help='Documents returned by the searches (default: 100000)')
+    parser.add_argument('--days', action='store', type=int, default=30, help='Days of daily beats and Wazuh indexes (default: 30)')
+    parser.add_argument('-m', '--monitors', action='store', type=int, default=0, help='Monitors existing at start (default: 0)')
+    parser.add_argument('--distribution', action='store', choices=["opendistro", "opensearch"], default="opendistro", help='Cluster answered as, opensearch stores the monitor triggers wrapped by type (default: opendistro)')
+    parser.add_argument('--ingest-rate', action='store', type=int, default=1000, help='Documents per second indexed in every index, for _stats/indexing (default: 1000)')
+    parser.add_argument('-l', '--latency', action='store', type=float, default=0, help='Latency added to every request in ms (default: 0)')
+    parser.add_argument('-j', '--jitter', action='store', type=float, default=0, help='Random latency of up to this many ms added to the latency (default: 0)')
+    parser.add_argument('-e', '--error-rate', action='store', type=float, default=0, help='Fraction of the requests answered with an error (default: 0)')
+    parser.add_argument('--error-status', action='store', type=int, default=503, help='HTTP status of the injected errors (default: 503)')
+    parser.add_argument('--retry-after', action='store', help='Retry-After header of the injected errors, in seconds')
+    parser.add_argument('--seed', action='store', type=int, help='Seed of the latency jitter and error injection')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    cluster = MockCluster(args.docs, args.days, args.monitors, args.ingest_rate, args.distribution)
+    server = MockServer((args.host, args.port), cluster, args.latency, args.jitter, args.error_rate, args.error_status, args.retry_after, args.verbose)
+    # The benchmark reads the URL from the first line
+    print("Listening on %s" % server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# Call main/start program and catch exceptions
+if __name__ == "__main__":
+    try:
+        main()
+    except SystemExit:
+        pass
+    except:
+        print("Exception occurred:")
+        print(traceback.format_exc())
+        sys.exit(1)
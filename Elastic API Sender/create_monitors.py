@@ -5,8 +5,14 @@ import sys
 import os
 import traceback
 import argparse
+import time
+import json
+import hashlib
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
 from api import *
+from monitor_templates import *
 
 # Alerts destination ids
 notification_destination_id1 = ""
@@ -24,6 +30,101 @@ cpu_percentage = "90"
 cpu_monitor_time = 10
 cpu_monitor_units = "MINUTES"
 
+# Monitor templates created for every hostname by default, CPU monitors are disabled
+default_monitor_templates = "storage,ram"
+# Monitor templates created for the whole fleet in bucket level mode
+default_bucket_monitor_templates = "bucket_storage,bucket_ram"
+monitor_templates_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "monitor_templates")
+
+
+# Variables available to the monitor templates
+def getTemplateVariables():
+    return {
+        "storage_percentage": storage_percentage,
+        "storage_critical_percentage": storage_critical_percentage,
+        "storage_monitor_time": storage_monitor_time,
+        "storage_monitor_time_units": storage_monitor_time_units.upper(),
+        "ram_percentage": ram_percentage,
+        "ram_monitor_time": ram_monitor_time,
+        "ram_monitor_units": ram_monitor_units.upper(),
+        "cpu_percentage": cpu_percentage,
+        "cpu_monitor_time": cpu_monitor_time,
+        "cpu_monitor_units": cpu_monitor_units.upper()
+    }
+
+
+# Actions added to every trigger: (action name, destination ID)
+def getDestinations():
+    return [("EnvioAlertaITS", notification_destination_id1), ("EnvioAlertaSupportCPD", notification_destination_id2)]
+
+
+# Keep from an existing monitor only the fields present in the desired payload, so fields added by the
+# alerting plugin (IDs, timestamps, schema version...) do not count as differences
+def projectMonitor(existing, desired):
+    if isinstance(desired, dict) and isinstance(existing, dict):
+        return {key: projectMonitor(existing[key], value) for key, value in desired.items() if key in existing}
+    if isinstance(desired, list) and isinstance(existing, list):
+        return [projectMonitor(e, d) for e, d in zip(existing, desired)] + existing[len(desired):]
+    return existing
+
+
+# OpenSearch Alerting 1.1+ returns the stored triggers wrapped by type, {"query_level_trigger": {...}} or
+# {"bucket_level_trigger": {...}}, while the per hostname payloads are sent unwrapped. Both sides are compared unwrapped
+def unwrapTriggers(monitor):
+    if not isinstance(monitor.get("triggers"), list):
+        return monitor
+    triggers = []
+    for trigger in monitor["triggers"]:
+        if isinstance(trigger, dict) and len(trigger) == 1:
+            triggerType = next(iter(trigger))
+            if triggerType in ("query_level_trigger", "bucket_level_trigger"):
+                trigger = trigger[triggerType]
+        triggers.append(trigger)
+    return dict(monitor, triggers=triggers)
+
+
+def normalizeMonitorValue(value):
+    if isinstance(value, dict):
+        return {key: normalizeMonitorValue(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [normalizeMonitorValue(item) for item in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def monitorHash(monitor):
+    return hashlib.sha1(json.dumps(normalizeMonitorValue(monitor), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# Index of existing monitors keyed by name: name -> (monitor ID, monitor)
+def buildMonitorIndex(existingMonitors):
+    index = {}
+    for monitorId, monitor in existingMonitors:
+        if monitor["name"] in index:
+            print("WARNING: Duplicated monitor '%s' (IDs %s and %s)" % (monitor["name"], index[monitor["name"]][0], monitorId))
+        index[monitor["name"]] = (monitorId, monitor)
+    return index
+
+
+# Run the jobs on the asyncio client, the workers being the limit of concurrent requests
+async def runJobsAsync(asyncApi, jobs):
+    async def runJob(job):
+        action, hostname, monitorType, payload, monitorId = job
+        try:
+            if action == "create":
+                return await asyncApi.createMonitor(payload)
+            elif action == "update":
+                return await asyncApi.updateMonitor(monitorId, payload)
+            else:
+                return await asyncApi.deleteMonitor(monitorId)
+        except Exception as e:
+            print("ERROR: %s of %s monitor for hostname %s failed: %s" % (action.capitalize(), monitorType, hostname, e))
+            return False
+
+    async with asyncApi:
+        return await asyncio.gather(*[runJob(job) for job in jobs])
+
 
 def main():
     # Get and check arguments
@@ -32,6 +133,15 @@ def main():
     parser.add_argument('-u', '--username', action='store', help='Username to access ElasticSearch API', required=True)
     #parser.add_argument('-p', '--password', action='store', help='Password to access ElasticSearch API', required=True)
     parser.add_argument('-f', '--csv-file', action='store', help='File to save agent hostnames of existing monitors', required=True)
+    parser.add_argument('-w', '--workers', action='store', type=int, default=1, help='Monitors created concurrently (default: 1)')
+    parser.add_argument('-a', '--async', dest='use_async', action='store_true', help='Send the monitors with the asyncio client (requires aiohttp),\nthe workers being the limit of concurrent requests')
+    parser.add_argument('-r', '--retries', action='store', type=int, default=3, help='Retries of a request on HTTP 429/502/503/504 or connection errors (default: 3)')
+    parser.add_argument('--backoff', action='store', type=float, default=1.0, help='Backoff factor in seconds of the retries, doubled on every retry (default: 1.0)')
+    parser.add_argument('-t', '--templates-dir', action='store', default=monitor_templates_dir, help='Directory of the monitor templates (default: %s)' % monitor_templates_dir)
+    parser.add_argument('-m', '--monitors', action='store', help='Comma separated monitor templates to create\n(default: %s, bucket level mode: %s)' % (default_monitor_templates, default_bucket_monitor_templates))
+    parser.add_argument('-b', '--bucket-level', action='store_true', help='Create one bucket level monitor per metric covering every hostname of the CSV\ninstead of one monitor per hostname (requires OpenSearch Alerting 1.1 or later)')
+    parser.add_argument('-s', '--sync', action='store_true', help='Only create or update the monitors that are missing or differ from the existing ones')
+    parser.add_argument('--prune', action='store_true', help='In sync mode, delete the monitors of hostnames not present in the CSV file,\nor the per hostname monitors replaced by bucket level monitors')
     args = parser.parse_args()
 
     # Initialize API class object
@@ -44,455 +154,105 @@ def main():
     api.session.verify = ""  # CA certificate for the TLS communication
     userpassword = getpass(prompt=("User '" + args.username + "' password: "))
     api.session.auth = (args.username, userpassword)
+    # Keep one pooled connection per worker, HTTP 429/503 answers are retried by the session
+    api.configureSession(poolMaxsize=max(10, args.workers), retries=args.retries, backoffFactor=args.backoff)
 
     # "Init" methods
     if not api.getValidEndpoint() or not api.checkClusterHealth():
         sys.exit(1)
 
+    # Bucket level monitors were added in the alerting plugin of OpenSearch 1.1, Open Distro does not have them
+    if args.bucket_level:
+        clusterVersion = api.getClusterVersion()
+        if clusterVersion is None:
+            sys.exit(1)
+        distribution, number = clusterVersion
+        if distribution != "opensearch" or number < (1, 1):
+            print("ERROR: Bucket level monitors require OpenSearch Alerting 1.1 or later, the cluster runs %s %s" % (distribution, ".".join(str(part) for part in number)))
+            sys.exit(1)
+
     # Check csv hostnames file exists
     if not os.path.exists(args.csv_file) or not os.path.isfile(args.csv_file):
         print("ERROR: File '%s' does not exist!" % args.csv_file)
         sys.exit(1)
 
-    # Read CSV and create monitors
-    print("Creating monitors")
+    # Compile the monitor templates
+    monitors = args.monitors or (default_bucket_monitor_templates if args.bucket_level else default_monitor_templates)
+    templates = loadTemplates(args.templates_dir, getTemplateVariables(), getDestinations(), [name.strip() for name in monitors.split(",")])
+
+    # Read CSV and build the monitors
     with open(args.csv_file, 'r', encoding="utf-8-sig") as file:
-        reader = csv.reader(file)
-        for row in reader:
-            hostname = row[0].strip()
-            # Storage usage monitors
-            print("Creating storage usage monitor for hostname %s" % hostname)
-            storageMonitorConfig = {
-                "type": "monitor",
-                "name": "[" + hostname.upper() + "] Storage usage",
-                "enabled": True,
-                "schedule": {
-                    "period": {
-                        "interval": storage_monitor_time,
-                        "unit": "" + storage_monitor_time_units.upper() + ""
-                    }
-                },
-                "inputs": [
-                    {
-                        "search": {
-                            "indices": [
-                                "metricbeat-*"
-                            ],
-                            "query": {
-                                "size": 0,
-                                "query": {
-                                    "bool": {
-                                        "filter": [
-                                            {
-                                                "range": {
-                                                    "@timestamp": {
-                                                        "from": "{{period_end}}||-" + str(
-                                                            storage_monitor_time) + "m",
-                                                        "to": "{{period_end}}",
-                                                        "include_lower": True,
-                                                        "include_upper": True,
-                                                        "format": "epoch_millis",
-                                                        "boost": 1.0
-                                                    }
-                                                }
-                                            },
-                                            {
-                                                "term": {
-                                                    "host.name": {
-                                                        "value": "" + hostname.lower() + "",
-                                                        "boost": 1.0
-                                                    }
-                                                }
-                                            }
-                                        ],
-                                        "adjust_pure_negative": True,
-                                        "boost": 1.0
-                                    }
-                                },
-                                "aggregations": {
-                                    "used": {
-                                        "max": {
-                                            "field": "system.fsstat.total_size.used"
-                                        }
-                                    },
-                                    "free": {
-                                        "max": {
-                                            "field": "system.fsstat.total_size.free"
-                                        }
-                                    },
-                                    "total": {
-                                        "max": {
-                                            "field": "system.fsstat.total_size.total"
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                ],
-                "triggers": [
-                    {
-                        "name": "Storage_" + storage_critical_percentage + "%",
-                        "severity": "5",
-                        "condition": {
-                            "script": {
-                                "source": "return ctx.results[0].aggregations.total.value == null || ctx.results[0].aggregations.used.value == null ? false :((ctx.results[0].aggregations.used.value*100)/ctx.results[0].aggregations.total.value) > " + storage_critical_percentage + "",
-                                "lang": "painless"
-                            }
-                        },
-                        "actions": [
-                            {
-                                "name": "EnvioAlertaITS",
-                                "destination_id": "" + notification_destination_id1 + "",
-                                "message_template": {
-                                    "source": """
-    Monitor "{{ctx.monitor.name}}" just entered alert status. Please investigate the issue.
-        - Trigger: {{ctx.trigger.name}}
-        - Severity: {{ctx.trigger.severity}}
-        - Period start: {{ctx.periodStart}}
-        - Period end: {{ctx.periodEnd}}
-
-    Storage reached the """ + storage_critical_percentage + """% threshold:
-        - Total storage (bytes): {{ctx.results.0.aggregations.total.value}}
-        - Used storage (bytes): {{ctx.results.0.aggregations.used.value}}
-        - Free storage (bytes): {{ctx.results.0.aggregations.free.value}}
-                                """,
-                                    "lang": "mustache"
-                                },
-                                "throttle_enabled": False,
-                                "subject_template": {
-                                    "source": "[ELK Alerts] " + hostname.upper() + " - Almacenamiento superior al " + storage_critical_percentage + "%",
-                                    "lang": "mustache"
-                                }
-                            },
-                            {
-                                "name": "EnvioAlertaSupportCPD",
-                                "destination_id": "" + notification_destination_id2 + "",
-                                "message_template": {
-                                    "source": """
-    Monitor "{{ctx.monitor.name}}" just entered alert status. Please investigate the issue.
-        - Trigger: {{ctx.trigger.name}}
-        - Severity: {{ctx.trigger.severity}}
-        - Period start: {{ctx.periodStart}}
-        - Period end: {{ctx.periodEnd}}
-
-    Storage reached the """ + storage_critical_percentage + """% threshold:
-        - Total storage (bytes): {{ctx.results.0.aggregations.total.value}}
-        - Used storage (bytes): {{ctx.results.0.aggregations.used.value}}
-        - Free storage (bytes): {{ctx.results.0.aggregations.free.value}}
-                                """,
-                                    "lang": "mustache"
-                                },
-                                "throttle_enabled": False,
-                                "subject_template": {
-                                    "source": "[ELK Alerts] " + hostname.upper() + " - Almacenamiento superior al " + storage_critical_percentage + "%",
-                                    "lang": "mustache"
-                                }
-                            }
-                        ]
-                    },
-                    {
-                        "name": "Storage_" + storage_percentage + "%",
-                        "severity": "3",
-                        "condition": {
-                            "script": {
-                                "source": "return ctx.results[0].aggregations.total.value == null || ctx.results[0].aggregations.used.value == null ? false :((ctx.results[0].aggregations.used.value*100)/ctx.results[0].aggregations.total.value) > " + storage_percentage + "",
-                                "lang": "painless"
-                            }
-                        },
-                        "actions": [
-                            {
-                                "name": "EnvioAlertaITS",
-                                "destination_id": "" + notification_destination_id1 + "",
-                                "message_template": {
-                                    "source": """
-    Monitor "{{ctx.monitor.name}}" just entered alert status. Please investigate the issue.
-        - Trigger: {{ctx.trigger.name}}
-        - Severity: {{ctx.trigger.severity}}
-        - Period start: {{ctx.periodStart}}
-        - Period end: {{ctx.periodEnd}}
-
-    Storage reached the """ + storage_percentage + """% threshold:
-        - Total storage (bytes): {{ctx.results.0.aggregations.total.value}}
-        - Used storage (bytes): {{ctx.results.0.aggregations.used.value}}
-        - Free storage (bytes): {{ctx.results.0.aggregations.free.value}}
-                                """,
-                                    "lang": "mustache"
-                                },
-                                "throttle_enabled": False,
-                                "subject_template": {
-                                    "source": "[ELK Alerts] " + hostname.upper() + " - Almacenamiento superior al " + storage_percentage + "%",
-                                    "lang": "mustache"
-                                }
-                            },
-                            {
-                                "name": "EnvioAlertaSupportCPD",
-                                "destination_id": "" + notification_destination_id2 + "",
-                                "message_template": {
-                                    "source": """
-    Monitor "{{ctx.monitor.name}}" just entered alert status. Please investigate the issue.
-        - Trigger: {{ctx.trigger.name}}
-        - Severity: {{ctx.trigger.severity}}
-        - Period start: {{ctx.periodStart}}
-        - Period end: {{ctx.periodEnd}}
-
-    Storage reached the """ + storage_percentage + """% threshold:
-        - Total storage (bytes): {{ctx.results.0.aggregations.total.value}}
-        - Used storage (bytes): {{ctx.results.0.aggregations.used.value}}
-        - Free storage (bytes): {{ctx.results.0.aggregations.free.value}}
-                                """,
-                                    "lang": "mustache"
-                                },
-                                "throttle_enabled": False,
-                                "subject_template": {
-                                    "source": "[ELK Alerts] " + hostname.upper() + " - Almacenamiento superior al " + storage_percentage + "%",
-                                    "lang": "mustache"
-                                }
-                            }
-                        ]
-                    }
-                ]
-            }
-            api.createMonitor(storageMonitorConfig)
-            # RAM usage monitors
-            print("Creating RAM usage monitor for hostname %s" % hostname)
-            ramMonitorConfig = {
-                "type": "monitor",
-                "name": "[" + hostname.upper() + "] RAM usage",
-                "enabled": True,
-                "schedule": {
-                    "period": {
-                        "interval": ram_monitor_time,
-                        "unit": "" + ram_monitor_units.upper() + ""
-                    }
-                },
-                "inputs": [
-                    {
-                        "search": {
-                            "indices": [
-                                "metricbeat-*"
-                            ],
-                            "query": {
-                                "size": 0,
-                                "query": {
-                                    "bool": {
-                                        "filter": [
-                                            {
-                                                "range": {
-                                                    "@timestamp": {
-                                                        "from": "{{period_end}}||-" + str(ram_monitor_time) + "m",
-                                                        "to": "{{period_end}}",
-                                                        "include_lower": True,
-                                                        "include_upper": True,
-                                                        "format": "epoch_millis",
-                                                        "boost": 1
-                                                    }
-                                                }
-                                            },
-                                            {
-                                                "term": {
-                                                    "agent.hostname": {
-                                                        "value": "" + hostname.upper() + "",
-                                                        "boost": 1
-                                                    }
-                                                }
-                                            }
-                                        ],
-                                        "adjust_pure_negative": True,
-                                        "boost": 1
-                                    }
-                                },
-                                "aggregations": {
-                                    "when": {
-                                        "avg": {
-                                            "field": "system.memory.used.pct"
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                ],
-                "triggers": [
-                    {
-                        "name": "RAM_" + ram_percentage + "%",
-                        "severity": "5",
-                        "condition": {
-                            "script": {
-                                "source": "return ctx.results[0].aggregations.when.value == null ? false : ctx.results[0].aggregations.when.value > 0." + ram_percentage + "",
-                                "lang": "painless"
-                            }
-                        },
-                        "actions": [
-                            {
-                                "name": "EnvioAlertaITS",
-                                "destination_id": "" + notification_destination_id1 + "",
-                                "message_template": {
-                                    "source": """
-    Monitor "{{ctx.monitor.name}}" just entered alert status. Please investigate the issue.
-        - Trigger: {{ctx.trigger.name}}
-        - Severity: {{ctx.trigger.severity}}
-        - Period start: {{ctx.periodStart}}
-        - Period end: {{ctx.periodEnd}}
-
-    RAM reached the """ + ram_percentage + """% threshold:
-        - Average RAM percentage: {{ctx.results.0.aggregations.when.value}}
-                                    """,
-                                    "lang": "mustache"
-                                },
-                                "throttle_enabled": False,
-                                "subject_template": {
-                                    "source": "[ELK Alerts] " + hostname.upper() + " - RAM superior al " + ram_percentage + "%",
-                                    "lang": "mustache"
-                                }
-                            },
-                            {
-                                "name": "EnvioAlertaSupportCPD",
-                                "destination_id": "" + notification_destination_id2 + "",
-                                "message_template": {
-                                    "source": """
-    Monitor "{{ctx.monitor.name}}" just entered alert status. Please investigate the issue.
-        - Trigger: {{ctx.trigger.name}}
-        - Severity: {{ctx.trigger.severity}}
-        - Period start: {{ctx.periodStart}}
-        - Period end: {{ctx.periodEnd}}
-
-    RAM reached the """ + ram_percentage + """% threshold:
-        - Average RAM percentage: {{ctx.results.0.aggregations.when.value}}
-                                    """,
-                                    "lang": "mustache"
-                                },
-                                "throttle_enabled": False,
-                                "subject_template": {
-                                    "source": "[ELK Alerts] " + hostname.upper() + " - RAM superior al " + ram_percentage + "%",
-                                    "lang": "mustache"
-                                }
-                            }
-                        ]
-                    }
-                ]
-            }
-            api.createMonitor(ramMonitorConfig)
-            # CPU usage monitors
-            '''print("Creating CPU usage monitor for hostname %s" % hostname)
-            cpuMonitorConfig = {
-                "type": "monitor",
-                "name": "[" + hostname.upper() + "] CPU usage",
-                "enabled": True,
-                "schedule": {
-                    "period": {
-                        "interval": cpuMonitorTime,
-                        "unit": "" + cpuMonitorUnits.upper() + ""
-                    }
-                },
-                "inputs": [
-                    {
-                        "search": {
-                            "indices": [
-                                "metricbeat-*"
-                            ],
-                            "query": {
-                                "size": 0,
-                                "query": {
-                                    "bool": {
-                                        "filter": [
-                                            {
-                                                "range": {
-                                                    "@timestamp": {
-                                                        "from": "{{period_end}}||-" + str(cpuMonitorTime) + "m",
-                                                        "to": "{{period_end}}",
-                                                        "include_lower": True,
-                                                        "include_upper": True,
-                                                        "format": "epoch_millis",
-                                                        "boost": 1
-                                                    }
-                                                }
-                                            },
-                                            {
-                                                "term": {
-                                                    "agent.hostname": {
-                                                        "value": "" + hostname.upper() + "",
-                                                        "boost": 1
-                                                    }
-                                                }
-                                            }
-                                        ],
-                                        "adjust_pure_negative": True,
-                                        "boost": 1
-                                    }
-                                },
-                                "aggregations": {
-                                    "when": {
-                                        "avg": {
-                                            "field": "system.cpu.total.pct"
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                ],
-                "triggers": [
-                    {
-                        "name": "CPU_" + cpuPercentage + "%",
-                        "severity": "5",
-                        "condition": {
-                            "script": {
-                                "source": "return ctx.results[0].aggregations.when.value == null ? false : ctx.results[0].aggregations.when.value > 0." + cpuPercentage + "",
-                                "lang": "painless"
-                            }
-                        },
-                        "actions": [
-                            {
-                                "name": "EnvioAlertaITS",
-                                "destination_id": "" + notificationDestinationID_ITS + "",
-                                "message_template": {
-                                    "source": """
-    Monitor "{{ctx.monitor.name}}" just entered alert status. Please investigate the issue.
-        - Trigger: {{ctx.trigger.name}}
-        - Severity: {{ctx.trigger.severity}}
-        - Period start: {{ctx.periodStart}}
-        - Period end: {{ctx.periodEnd}}
-
-    CPU reached the """ + ramPercentage + """% threshold:
-        - Average CPU percentage: {{ctx.results.0.aggregations.when.value}}
-                                    """,
-                                    "lang": "mustache"
-                                },
-                                "throttle_enabled": False,
-                                "subject_template": {
-                                    "source": "[ELK Alerts] " + hostname.upper() + " - CPU superior al " + cpuPercentage + "%",
-                                    "lang": "mustache"
-                                }
-                            },
-                            {
-                                "name": "EnvioAlerta",
-                                "destination_id": "" + notificationDestinationID_SUPPORTCPD + "",
-                                "message_template": {
-                                    "source": """
-    Monitor "{{ctx.monitor.name}}" just entered alert status. Please investigate the issue.
-        - Trigger: {{ctx.trigger.name}}
-        - Severity: {{ctx.trigger.severity}}
-        - Period start: {{ctx.periodStart}}
-        - Period end: {{ctx.periodEnd}}
-
-    CPU reached the """ + ramPercentage + """% threshold:
-        - Average CPU percentage: {{ctx.results.0.aggregations.when.value}}
-                                    """,
-                                    "lang": "mustache"
-                                },
-                                "throttle_enabled": False,
-                                "subject_template": {
-                                    "source": "[ELK Alerts] " + hostname.upper() + " - CPU superior al " + cpuPercentage + "%",
-                                    "lang": "mustache"
-                                }
-                            }
-                        ]
-                    }
-                ]
-            }
-            api.createMonitor(cpuMonitorConfig)'''
+        hostnames = [row[0].strip() for row in csv.reader(file) if row and row[0].strip()]
+    if args.bucket_level:
+        desired = [("ALL", template.description, template.stampFleet(hostnames)) for template in templates]
+    else:
+        desired = [(hostname, template.description, template.stampHost(hostname)) for hostname in hostnames for template in templates]
+
+    # Jobs: (action, hostname, monitor type, payload, monitor ID)
+    if args.sync:
+        existingMonitors = api.searchMonitors()
+        if existingMonitors is None:
+            sys.exit(1)
+        index = buildMonitorIndex(existingMonitors)
+        jobs = []
+        for hostname, monitorType, payload in desired:
+            existing = index.pop(payload["name"], None)
+            if existing is None:
+                jobs.append(("create", hostname, monitorType, payload, None))
+            elif monitorHash(projectMonitor(unwrapTriggers(existing[1]), unwrapTriggers(payload))) != monitorHash(unwrapTriggers(payload)):
+                jobs.append(("update", hostname, monitorType, payload, existing[0]))
+        if args.prune:
+            # Monitors named like ours that are no longer wanted: hostnames removed from the CSV, or the per host
+            # monitors replaced by bucket level monitors
+            suffixes = tuple(set("] " + payload["name"].split("] ", 1)[1] for hostname, monitorType, payload in desired))
+            for name, (monitorId, monitor) in index.items():
+                if name.startswith("[") and name.endswith(suffixes):
+                    jobs.append(("delete", name[1:name.index("]")], name.split("] ", 1)[1], None, monitorId))
+        print("Sync: %s monitors up to date, %s to create, %s to update, %s to delete" % (
+            len(desired) - sum(1 for job in jobs if job[0] != "delete"),
+            sum(1 for job in jobs if job[0] == "create"),
+            sum(1 for job in jobs if job[0] == "update"),
+            sum(1 for job in jobs if job[0] == "delete")))
+    else:
+        jobs = [("create", hostname, monitorType, payload, None) for hostname, monitorType, payload in desired]
 
+    def runJob(job):
+        action, hostname, monitorType, payload, monitorId = job
+        try:
+            if action == "create":
+                print("Creating %s monitor for hostname %s" % (monitorType, hostname))
+                return api.createMonitor(payload)
+            elif action == "update":
+                print("Updating %s monitor for hostname %s" % (monitorType, hostname))
+                return api.updateMonitor(monitorId, payload)
+            else:
+                print("Deleting %s monitor for hostname %s" % (monitorType, hostname))
+                return api.deleteMonitor(monitorId)
+        except Exception as e:
+            print("ERROR: %s of %s monitor for hostname %s failed: %s" % (action.capitalize(), monitorType, hostname, e))
+            return False
+
+    print("Applying monitors")
+    start = time.monotonic()
+    if args.use_async:
+        from api_async import AsyncAPI
+        results = list(asyncio.run(runJobsAsync(AsyncAPI.fromAPI(api, max(1, args.workers), args.retries, args.backoff), jobs)))
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            results = list(executor.map(runJob, jobs))
+    elapsed = time.monotonic() - start
+
+    # Summary
+    failures = {}
+    for (action, hostname, monitorType, payload, monitorId), succeeded in zip(jobs, results):
+        if not succeeded:
+            failures.setdefault(hostname, []).append("%s %s" % (action, monitorType))
+    print("Applied %s of %s monitor changes for %s hostnames in %.1fs (%.1f requests/s)" % (results.count(True), len(jobs), len(hostnames), elapsed, len(jobs) / elapsed if elapsed else 0))
+    if failures:
+        print("Failed monitors:")
+        for hostname, monitorTypes in failures.items():
+            print("  - %s: %s" % (hostname, ", ".join(monitorTypes)))
+        sys.exit(1)
 
 # Call main/start program and catch exceptions
 try:
@@ -11,6 +11,7 @@ from getpass import getpass
 from api import *
 
 csvHeader = ["Timestamp","Hostname","Log level","Message"]
+summaryHeader = ["Hostname","Time","Log level","Count"]
 today = date.today()
 dateTo = "now"
 dateFrom = (today - timedelta(days = 2)).strftime("%Y-%m-%d") + "T22:00:00.000Z"
@@ -21,6 +22,38 @@ def convertElasticTimestamp(timestamp):
     result = result + timedelta(hours=2)
     return result.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
 
+def hitToRow(hit):
+    return {
+        "Timestamp": convertElasticTimestamp(hit["_source"]["@timestamp"]),
+        "Hostname": hit["_source"]["agent"]["hostname"],
+        "Log level": hit["_source"]["log"]["level"],
+        "Message": hit["_source"]["message"]
+    }
+
+# Composite aggregation sources of the summary mode: hostname x time bucket x log level, the time buckets in the time
+# zone of the date histogram of searchRequest
+def summarySources(interval):
+    histogram = searchRequest["aggs"]["2"]["date_histogram"]
+    return [
+        {"hostname": {"terms": {"field": "agent.hostname"}}},
+        {"time": {"date_histogram": {"field": histogram["field"], "fixed_interval": interval, "time_zone": histogram["time_zone"], "format": "yyyy-MM-dd HH:mm"}}},
+        {"level": {"terms": {"field": "log.level", "missing_bucket": True}}}
+    ]
+
+def summarySamples(samples):
+    return {"samples": {"top_hits": {"size": samples, "_source": ["message"], "sort": [{"@timestamp": {"order": "desc"}}]}}}
+
+def bucketToRow(bucket):
+    row = {
+        "Hostname": bucket["key"]["hostname"],
+        "Time": bucket["key"]["time"],
+        "Log level": bucket["key"]["level"] if bucket["key"]["level"] is not None else "-",
+        "Count": bucket["doc_count"]
+    }
+    if "samples" in bucket:
+        row["Sample messages"] = " | ".join(hit["_source"].get("message", "").replace("\n", " ") for hit in bucket["samples"]["hits"]["hits"])
+    return row
+
 def main():
     # Get and check arguments
     parser = argparse.ArgumentParser(description="Export a search to csv.",formatter_class=argparse.RawTextHelpFormatter)
@@ -28,6 +61,16 @@ def main():
     parser.add_argument('-u', '--username', action='store', help='Username to access ElasticSearch API', required=True)
     #parser.add_argument('-p', '--password', action='store', help='Password to access ElasticSearch API', required=True)
     parser.add_argument('-o', '--csv-file', action='store', help='Path to the CSV file to save results', required=True)
+    parser.add_argument('-s', '--stream', action='store_true', help='Page through every hit with search_after and write each page as it arrives,\nwithout the 10000 hits limit')
+    parser.add_argument('--page-size', action='store', type=int, default=1000, help='Hits per page in stream and sliced modes, buckets per page in summary mode (default: 1000)')
+    parser.add_argument('--slices', action='store', type=int, default=0, help='Export with a sliced scroll using this number of slices')
+    parser.add_argument('--workers', action='store', type=int, default=0, help='Threads used to pull the slices (default: one per slice)')
+    parser.add_argument('--sorted', action='store_true', help='Merge the slices ordered by timestamp instead of writing pages as they arrive')
+    parser.add_argument('--summary', action='store_true', help='Export the number of errors per hostname, time bucket and log level counted by the cluster\nwith a composite aggregation, instead of the hits')
+    parser.add_argument('--interval', action='store', default="1h", help='Time bucket of the summary mode (default: 1h)')
+    parser.add_argument('--samples', action='store', type=int, default=0, help='Latest messages added to every bucket of the summary mode (default: 0)')
+    parser.add_argument('--date-from', action='store', help='Start of the exported time range (default: %s)' % dateFrom)
+    parser.add_argument('--date-to', action='store', help='End of the exported time range (default: %s)' % dateTo)
     args = parser.parse_args()
 
     # Initialize API class object
@@ -45,6 +88,45 @@ def main():
     if not api.getValidEndpoint() or not api.checkClusterHealth():
         sys.exit(1)
 
+    # Time range
+    timeRange = searchRequest["query"]["bool"]["filter"][-1]["range"]["@timestamp"]
+    if args.date_from:
+        timeRange["gte"] = args.date_from
+    if args.date_to:
+        timeRange["lte"] = args.date_to
+
+    # Summary export, the cluster counts the errors and every page of buckets is written as soon as it is received
+    if args.summary:
+        pages = api.compositeAggregation("filebeat-*", searchRequest, summarySources(args.interval), pageSize=args.page_size,
+                                         subAggregations=summarySamples(args.samples) if args.samples > 0 else None)
+        print("Exporting summary to csv file %s" % args.csv_file)
+        buckets = 0
+        errors = 0
+        with open(args.csv_file, "w", newline='') as dataFile:
+            csvWriter = csv.DictWriter(dataFile, delimiter=";", fieldnames=summaryHeader + (["Sample messages"] if args.samples > 0 else []))
+            csvWriter.writeheader()
+            for page in pages:
+                rows = [bucketToRow(bucket) for bucket in page]
+                csvWriter.writerows(rows)
+                buckets += len(rows)
+                errors += sum(row["Count"] for row in rows)
+        print("Exported %s buckets counting %s errors" % (buckets, errors))
+        return
+
+    # Streaming and sliced exports, every page is written to the CSV as soon as it is received
+    if args.stream or args.slices:
+        if args.slices:
+            pages = api.slicedSearch("filebeat-*", searchRequest, slices=args.slices, workers=args.workers, pageSize=args.page_size, ordered=args.sorted)
+        else:
+            pages = api.searchAfter("filebeat-*", searchRequest, pageSize=args.page_size)
+        print("Exporting results to csv file %s" % args.csv_file)
+        with open(args.csv_file, "w", newline='') as dataFile:
+            csvWriter = csv.DictWriter(dataFile, delimiter=";", fieldnames=csvHeader)
+            csvWriter.writeheader()
+            for hits in pages:
+                csvWriter.writerows(hitToRow(hit) for hit in hits)
+        return
+
     # Perform search
     result = api.search("filebeat-*", searchRequest)
 
@@ -54,12 +136,7 @@ def main():
     hitsData = {"hits": []}
 
     for hit in hits:
-        hitsData["hits"].append({
-            "Timestamp": convertElasticTimestamp(hit["_source"]["@timestamp"]),
-            "Hostname": hit["_source"]["agent"]["hostname"],
-            "Log level": hit["_source"]["log"]["level"],
-            "Message": hit["_source"]["message"]
-        })
+        hitsData["hits"].append(hitToRow(hit))
 
     dataFile = open(args.csv_file, "w", newline='')
     csvWriter = csv.DictWriter(dataFile, delimiter=";", fieldnames=csvHeader)
@@ -67,7 +144,6 @@ def main():
     csvWriter.writerows(hitsData["hits"])
     dataFile.close()
 
-
 # Call main/start program and catch exceptions
 try:
     main()
@@ -0,0 +1,119 @@
+import json
+import time
+
+# Named settings profiles for the ingest windows, e.g. Wazuh full vulnerability scans or end of month log bursts.
+# Flat setting names, as read with flat_settings=true, so they match the snapshots taken before applying them
+profiles = {
+    "ingest": {
+        "index.refresh_interval": "60s",
+        "index.translog.durability": "async"
+    },
+    "scan": {
+        "index.refresh_interval": "120s",
+        "index.number_of_replicas": "0",
+        "index.translog.durability": "async"
+    },
+    "bulk": {
+        "index.refresh_interval": "-1",
+        "index.number_of_replicas": "0",
+        "index.translog.durability": "async"
+    }
+}
+
+# Longest comma separated list of indices sent in one request, below the 4KB HTTP initial line limit
+maxIndicesLength = 3000
+
+
+# {"index": {"refresh_interval": "60s"}} -> {"index.refresh_interval": "60s"}
+def flattenSettings(settings, prefix=""):
+    flat = {}
+    for key, value in settings.items():
+        if isinstance(value, dict):
+            flat.update(flattenSettings(value, prefix + key + "."))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+# Built in profiles plus the profiles of a JSON file, {"name": {"index.setting": value}}. Nested settings and names
+# without the "index." prefix are accepted
+def loadProfiles(path=None):
+    result = dict(profiles)
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            custom = json.load(f)
+        for name, settings in custom.items():
+            flat = flattenSettings(settings)
+            result[name] = {(key if key.startswith("index.") else "index." + key): value for key, value in flat.items()}
+    return result
+
+
+# Split a list of indices in comma separated groups short enough for the request line
+def joinIndices(indices, maxLength=maxIndicesLength):
+    group = []
+    length = 0
+    for index in indices:
+        if group and length + len(index) + 1 > maxLength:
+            yield ",".join(group)
+            group = []
+            length = 0
+        group.append(index)
+        length += len(index) + 1
+    if group:
+        yield ",".join(group)
+
+
+# Current value of the settings of every matching index, None for the settings left to their default so the
+# revert resets them. None on error
+def snapshotSettings(api, target, names):
+    content = api.getIndexSettings(target, names, ignoreUnavailable=True)
+    if content is None:
+        return None
+    snapshot = {}
+    for index, settings in content.items():
+        explicit = settings.get("settings", {})
+        snapshot[index] = {name: explicit.get(name) for name in names}
+    return snapshot
+
+
+def writeSnapshot(path, profileName, patterns, snapshot):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"profile": profileName, "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "patterns": patterns, "indices": snapshot}, f, indent=2)
+
+
+def readSnapshot(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["indices"]
+
+
+# Put back the settings of a snapshot, one request per group of indices with the same prior values
+def restoreSnapshot(api, snapshot):
+    groups = {}
+    for index, values in snapshot.items():
+        groups.setdefault(json.dumps(values, sort_keys=True), []).append(index)
+    restored = True
+    for values, indices in groups.items():
+        for target in joinIndices(sorted(indices)):
+            if not api.putIndexSettings(target, json.loads(values), ignoreUnavailable=True):
+                restored = False
+    return restored
+
+
+def indexedDocs(api, target):
+    stats = api.getIndexingStats(target, ignoreUnavailable=True)
+    if stats is None:
+        return None
+    return stats.get("index_total", 0)
+
+
+# Documents indexed per second in the primary shards of the indices during the sampling window. None on error
+def measureIndexingRate(api, target, seconds):
+    before = indexedDocs(api, target)
+    start = time.monotonic()
+    time.sleep(seconds)
+    after = indexedDocs(api, target)
+    elapsed = time.monotonic() - start
+    if before is None or after is None:
+        return None
+    # Indices deleted during the window lower the total
+    return max(0, after - before) / elapsed
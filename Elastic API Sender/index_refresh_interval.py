@@ -1,22 +1,119 @@
 __version__ = '2021.08.27.01'
 
 import sys
+import time
+import asyncio
 import traceback
 import argparse
 from api import *
+from index_profiles import *
 from getpass import getpass
 from datetime import date
 
 
+# Index families of the beats and Wazuh daily indices
+indexFamilies = ["filebeat-%s", "metricbeat-%s", "heartbeat-%s", "wazuh-monitoring", "wazuh-alerts-4.x"]
+
+
+def printRates(rateBefore, rateAfter, profileName):
+    if rateBefore is None or rateAfter is None:
+        print("WARNING: The indexing rate could not be sampled")
+        return
+    print("Indexing rate before: %.1f docs/s, with profile %s: %.1f docs/s" % (rateBefore, profileName, rateAfter))
+    if rateBefore > 0:
+        print("Gain: %+.1f docs/s (%+.1f%%)" % (rateAfter - rateBefore, (rateAfter - rateBefore) / rateBefore * 100))
+
+
+# Apply the settings to every index concurrently with the asyncio client, one request per index. True if every
+# request succeeded
+def putIndexSettingsAsync(api, indexes, settings):
+    from api_async import AsyncAPI
+
+    async def applyAll():
+        async with AsyncAPI.fromAPI(api) as asyncApi:
+            return await asyncio.gather(*[asyncApi.putIndexSettings(index, settings, ignoreUnavailable=True) for index in indexes])
+    return all(asyncio.run(applyAll()))
+
+
+# Apply a settings profile to the matching indexes for an ingest window. The prior values are saved to a snapshot
+# file first, the profile is applied to the snapshotted indexes only and the indexing rate is sampled before and
+# after. With --hold the previous settings are restored at the end of the window, also on Ctrl+C or errors
+def applyProfile(api, args, settings, indexPatterns):
+    target = ",".join(indexPatterns)
+    snapshot = snapshotSettings(api, target, sorted(settings))
+    if snapshot is None:
+        return False
+    if not snapshot:
+        print("No indexes to apply profile %s" % args.profile)
+        return True
+    snapshotFile = args.snapshot or "index_settings_%s_%s.json" % (args.profile, time.strftime("%Y%m%d%H%M%S"))
+    writeSnapshot(snapshotFile, args.profile, indexPatterns, snapshot)
+    print("Saved the previous settings of %s indexes to %s, restore them with --restore %s" % (len(snapshot), snapshotFile, snapshotFile))
+
+    rateBefore = None
+    if args.sample_seconds > 0:
+        print("Sampling the indexing rate for %ss..." % args.sample_seconds)
+        rateBefore = measureIndexingRate(api, target, args.sample_seconds)
+
+    print("Applying profile %s: %s" % (args.profile, settings))
+    if args.use_async:
+        applied = putIndexSettingsAsync(api, sorted(snapshot), settings)
+    else:
+        applied = all(api.putIndexSettings(indexes, settings, ignoreUnavailable=True) for indexes in joinIndices(sorted(snapshot)))
+    if not applied:
+        print("Restoring the previous settings...")
+        restoreSnapshot(api, snapshot)
+        return False
+
+    restored = True
+    try:
+        if args.sample_seconds > 0:
+            print("Sampling the indexing rate with profile %s for %ss..." % (args.profile, args.sample_seconds))
+            printRates(rateBefore, measureIndexingRate(api, target, args.sample_seconds), args.profile)
+        if args.hold > 0:
+            print("Holding profile %s, the previous settings are restored in %ss" % (args.profile, max(0, args.hold - args.sample_seconds)))
+            time.sleep(max(0, args.hold - args.sample_seconds))
+    finally:
+        if args.hold > 0:
+            print("Restoring the previous settings...")
+            restored = restoreSnapshot(api, snapshot)
+    return restored
+
+
 def main():
     # Get and check arguments
-    parser = argparse.ArgumentParser(description="Apply refresh_interval setting to today's beats indexes.", formatter_class=argparse.RawTextHelpFormatter)
+    parser = argparse.ArgumentParser(description="Apply refresh_interval setting to the beats and Wazuh indexes and to their index template.", formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument('-v', '--version', action='version', version=__version__)
     parser.add_argument('-u', '--username', action='store', help='Username to access ElasticSearch API', required=True)
     parser.add_argument('-p', '--password', action='store', help='Password to access ElasticSearch API', required=True)
-    parser.add_argument('-b', '--beats-version', action='store', help='Version of the beats agents', required=True)
+    parser.add_argument('-b', '--beats-version', action='store', help='Version of the beats agents, all versions if not set')
+    parser.add_argument('-i', '--indices', action='store', help='Comma separated index patterns instead of the beats and Wazuh indexes, e.g. "filebeat-*,wazuh-alerts-4.x-*"')
+    parser.add_argument('-r', '--refresh-interval', action='store', default="60s", help='Refresh interval to apply (default: 60s)')
+    parser.add_argument('--today', action='store_true', help="Only apply the settings to today's indexes")
+    parser.add_argument('--template-name', action='store', default="wazuh-scripts-refresh-interval", help='Name of the index template applying the setting to new indexes (default: wazuh-scripts-refresh-interval)')
+    parser.add_argument('--template-order', action='store', type=int, default=100, help='Order of the index template, higher than the beats and Wazuh templates it is merged with (default: 100)')
+    parser.add_argument('--no-template', action='store_true', help='Do not create the index template')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='Only show the indexes matching the patterns')
+    parser.add_argument('-a', '--async', dest='use_async', action='store_true', help='Apply the settings concurrently with the asyncio client, one request per index (requires aiohttp)')
+    parser.add_argument('-P', '--profile', action='store', help='Apply a settings profile for an ingest window instead of the refresh interval, see --list-profiles')
+    parser.add_argument('--profiles-file', action='store', help='JSON file with more profiles, {"name": {"index.setting": value}}')
+    parser.add_argument('--list-profiles', action='store_true', help='Show the profiles and exit')
+    parser.add_argument('--snapshot', action='store', help='File to save the previous settings to (default: index_settings_<profile>_<time>.json)')
+    parser.add_argument('--restore', action='store', help='Restore the settings saved in a snapshot file and exit')
+    parser.add_argument('--hold', action='store', type=int, default=0, help='Seconds to keep the profile before restoring the previous settings, 0 keeps it until --restore (default: 0)')
+    parser.add_argument('--sample-seconds', action='store', type=int, default=30, help='Seconds of indexing rate sampling before and after applying the profile, 0 disables it (default: 30)')
     args = parser.parse_args()
 
+    # Settings profiles
+    availableProfiles = loadProfiles(args.profiles_file)
+    if args.list_profiles:
+        for name, settings in availableProfiles.items():
+            print("%s: %s" % (name, settings))
+        return
+    if args.profile and args.profile not in availableProfiles:
+        print("ERROR: Profile %s not found, available profiles: %s" % (args.profile, ", ".join(availableProfiles)))
+        sys.exit(1)
+
     # Initialize API class object
     api = API()
 
@@ -32,28 +129,70 @@ def main():
     if not api.getValidEndpoint() or not api.checkClusterHealth():
         sys.exit(1)
 
-    # Indexes names
-    today = date.today()
-    filebeatIndex = "filebeat-" + args.beats_version + "-" + today.strftime("%Y.%m.%d")
-    metricbeatIndex = "metricbeat-" + args.beats_version + "-" + today.strftime("%Y.%m.%d")
-    heartbeatIndex = "heartbeat-" + args.beats_version + "-" + today.strftime("%Y.%m.%d")
-    wazuhmonitoringIndex = "wazuh-monitoring-" + today.strftime("%Y.%m.%d")
-    wazuhalertsIndex = "wazuh-alerts-4.x-" + today.strftime("%Y.%m.%d")
+    # Restore the settings saved before a profile was applied
+    if args.restore:
+        print("Restoring the settings saved in %s" % args.restore)
+        if not restoreSnapshot(api, readSnapshot(args.restore)):
+            sys.exit(1)
+        return
+
+    # Indexes patterns
+    if args.indices:
+        templatePatterns = [pattern.strip() for pattern in args.indices.split(",") if pattern.strip()]
+    else:
+        beatsVersion = args.beats_version or "*"
+        templatePatterns = [(family % beatsVersion if "%s" in family else family) + "-*" for family in indexFamilies]
+    if args.today:
+        suffix = date.today().strftime("%Y.%m.%d")
+        indexPatterns = [pattern[:-1] + suffix if pattern.endswith("-*") else pattern for pattern in templatePatterns]
+    else:
+        indexPatterns = templatePatterns
 
     # Config to apply to beats index
     config = {
         "index":
             {
-                "refresh_interval": "60s"
+                "refresh_interval": args.refresh_interval
             }
     }
 
-    # Apply config
-    api.putIndexSettings(filebeatIndex, config)
-    api.putIndexSettings(metricbeatIndex, config)
-    api.putIndexSettings(heartbeatIndex, config)
-    api.putIndexSettings(wazuhmonitoringIndex, config)
-    api.putIndexSettings(wazuhalertsIndex, config)
+    # Resolve the patterns in one call
+    indexes = api.resolveIndices(indexPatterns)
+    if indexes is None:
+        sys.exit(1)
+    print("Found %s indexes matching %s" % (len(indexes), ",".join(indexPatterns)))
+    for index in indexes:
+        print("  - %s" % index)
+    if args.dry_run:
+        if args.profile:
+            print("Profile %s: %s" % (args.profile, availableProfiles[args.profile]))
+        return
+
+    # Settings profile, the index template is left as it is
+    if args.profile:
+        if not applyProfile(api, args, availableProfiles[args.profile], indexPatterns):
+            sys.exit(1)
+        return
+
+    # Apply config to every matching index in a single request, or one request per index with --async
+    failed = False
+    if args.use_async:
+        if indexes and not putIndexSettingsAsync(api, indexes, config):
+            failed = True
+    elif indexes and not api.putIndexSettings(",".join(indexPatterns), config, ignoreUnavailable=True):
+        failed = True
+
+    # Index template, the new daily indexes are created with the config
+    if not args.no_template:
+        template = {
+            "index_patterns": templatePatterns,
+            "order": args.template_order,
+            "settings": config
+        }
+        if not api.putTemplate(args.template_name, template):
+            failed = True
+    if failed:
+        sys.exit(1)
 
 
 # Call main/start program and catch exceptions
@@ -0,0 +1,170 @@
+import os
+import re
+import json
+
+# Variables that change for every stamped monitor, the rest are resolved once when the template is compiled
+stampVariables = ("hostname", "hostname_upper", "hostname_lower", "hostnames", "hostnames_upper", "hostnames_lower", "hostnames_count")
+
+placeholderPattern = re.compile(r"\$\{(\w+)\}")
+
+
+def hostVariables(hostname):
+    return {"hostname": hostname, "hostname_upper": hostname.upper(), "hostname_lower": hostname.lower()}
+
+
+# Variables of the monitors that cover the whole fleet with a single bucket level monitor
+def fleetVariables(hostnames):
+    return {
+        "hostnames": list(hostnames),
+        "hostnames_upper": [hostname.upper() for hostname in hostnames],
+        "hostnames_lower": [hostname.lower() for hostname in hostnames],
+        "hostnames_count": max(1, len(hostnames))
+    }
+
+
+# Load a template file, JSON or YAML (YAML requires PyYAML)
+def loadTemplateFile(path):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yml", ".yaml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("PyYAML is required to load the YAML template %s" % path)
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+# Replace the compile time variables of a string. A string that is a single placeholder is replaced by the raw
+# value so numbers and lists keep their type. Stamp variables are left in place.
+def resolveString(text, variables):
+    match = placeholderPattern.fullmatch(text)
+    if match and match.group(1) not in stampVariables:
+        return variables[match.group(1)]
+
+    def replace(match):
+        name = match.group(1)
+        if name in stampVariables:
+            return match.group(0)
+        return str(variables[name])
+
+    return placeholderPattern.sub(replace, text)
+
+
+def resolve(node, variables):
+    if isinstance(node, dict):
+        return {key: resolve(value, variables) for key, value in node.items()}
+    if isinstance(node, list):
+        return [resolve(value, variables) for value in node]
+    if isinstance(node, str):
+        return resolveString(node, variables)
+    return node
+
+
+# Compile a resolved node into None when it does not depend on the stamp variables, or into a function that
+# builds a copy of the node from the stamp variables. Only the containers on the path to a stamped leaf are
+# copied, every other subtree is shared between the stamped monitors.
+def compileNode(node):
+    if isinstance(node, dict):
+        builders = [(key, builder) for key, builder in ((key, compileNode(value)) for key, value in node.items()) if builder]
+        if not builders:
+            return None
+
+        def buildDict(values):
+            result = node.copy()
+            for key, builder in builders:
+                result[key] = builder(values)
+            return result
+        return buildDict
+    if isinstance(node, list):
+        builders = [(index, builder) for index, builder in ((index, compileNode(value)) for index, value in enumerate(node)) if builder]
+        if not builders:
+            return None
+
+        def buildList(values):
+            result = list(node)
+            for index, builder in builders:
+                result[index] = builder(values)
+            return result
+        return buildList
+    if isinstance(node, str) and placeholderPattern.search(node):
+        match = placeholderPattern.fullmatch(node)
+        if match:
+            name = match.group(1)
+            return lambda values: values[name]
+        # Turn the string into a format string, escaping the mustache braces
+        fmt = placeholderPattern.sub(lambda match: "\0" + match.group(1) + "\1", node)
+        fmt = fmt.replace("{", "{{").replace("}", "}}").replace("\0", "{").replace("\1", "}")
+        return lambda values: fmt.format_map(values)
+    return None
+
+
+# Monitor template compiled once and stamped for every hostname.
+# A template file holds the monitor body ("monitor"), the triggers ("triggers", each one with its own "variables"
+# and "trigger" body) and the action sent to every destination ("action"). Placeholders use the ${variable}
+# syntax so they do not clash with the mustache templates of the alerting plugin.
+# Stamped monitors share their static subtrees, they must not be modified in place.
+class MonitorTemplate(object):
+
+    def __init__(self, name, template):
+        self.name = name
+        self.description = template.get("description", name)
+        self.template = template
+        self.skeleton = None
+        self.builder = None
+
+    @classmethod
+    def fromFile(cls, path):
+        name = os.path.splitext(os.path.basename(path))[0]
+        return cls(name, loadTemplateFile(path))
+
+    # Resolve the settings variables and expand the triggers and actions, destinations is a list of (name, ID)
+    def compile(self, variables, destinations):
+        monitor = resolve(self.template["monitor"], variables)
+        if "triggers" in self.template:
+            triggers = []
+            for trigger in self.template["triggers"]:
+                triggerVariables = dict(variables)
+                triggerVariables.update(resolve(trigger.get("variables", {}), variables))
+                body = resolve(trigger["trigger"], triggerVariables)
+                action = resolve(self.template.get("action", trigger.get("action", {})), triggerVariables)
+                actions = []
+                for destinationName, destinationId in destinations:
+                    actions.append(dict({"name": destinationName, "destination_id": destinationId}, **action))
+                # Bucket level triggers wrap the trigger body
+                if "bucket_level_trigger" in body:
+                    body["bucket_level_trigger"]["actions"] = actions
+                else:
+                    body["actions"] = actions
+                triggers.append(body)
+            monitor["triggers"] = triggers
+        self.skeleton = monitor
+        self.builder = compileNode(monitor)
+        return self
+
+    # Build the monitor payload for the given stamp variables
+    def stamp(self, values):
+        if self.builder is None:
+            return self.skeleton
+        return self.builder(values)
+
+    def stampHost(self, hostname):
+        return self.stamp(hostVariables(hostname))
+
+    def stampFleet(self, hostnames):
+        return self.stamp(fleetVariables(hostnames))
+
+
+# Load and compile every template of a directory, only the listed template names when names is given
+def loadTemplates(directory, variables, destinations, names=None):
+    templates = {}
+    for file in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(file)
+        if extension not in (".json", ".yml", ".yaml") or (names and name not in names):
+            continue
+        templates[name] = MonitorTemplate.fromFile(os.path.join(directory, file)).compile(variables, destinations)
+    if names:
+        missing = [name for name in names if name not in templates]
+        if missing:
+            raise RuntimeError("Monitor templates not found in %s: %s" % (directory, ", ".join(missing)))
+        return [templates[name] for name in names]
+    return list(templates.values())
@@ -2,11 +2,148 @@
 
 import smtplib
 import os
+import time
+import uuid
+import zlib
+import base64
+import zipfile
+import threading
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import formatdate
-from email import encoders
+from email import policy
+
+# Bytes read from the attachment files at once, a multiple of 57 so every chunk is encoded to whole base64 lines
+chunk_size = 57 * 1024
+
+
+# Attachment streamed while the email is sent: the parts are chained without copying them to a file or memory,
+# bytes are sent as they are and strings are paths of files read from disk. Compression: None, "gzip" or "zip"
+class Attachment(object):
+
+    def __init__(self, filename, parts, compress=None):
+        self.filename = filename
+        self.parts = parts
+        self.compress = compress
+        if compress == "gzip":
+            self.name = filename + ".gz"
+        elif compress == "zip":
+            self.name = filename + ".zip"
+        elif not compress:
+            self.name = filename
+        else:
+            raise ValueError("compression '%s' not identified" % compress)
+
+    def raw_chunks(self):
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            with open(part, "rb") as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+
+    def chunks(self):
+        if self.compress == "gzip":
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            for chunk in self.raw_chunks():
+                yield compressor.compress(chunk)
+            yield compressor.flush()
+        elif self.compress == "zip":
+            # ZipFile writes to an unseekable stream using data descriptors, the output is taken after every write
+            stream = ChunkStream()
+            with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+                with archive.open(self.filename, "w", force_zip64=True) as f:
+                    for chunk in self.raw_chunks():
+                        f.write(chunk)
+                        yield stream.take()
+            yield stream.take()
+        else:
+            for chunk in self.raw_chunks():
+                yield chunk
+
+    # Attachment content as base64 lines of 76 characters
+    def base64_chunks(self):
+        pending = b""
+        for chunk in self.chunks():
+            pending += chunk
+            size = len(pending) - len(pending) % 57
+            if size:
+                yield base64.encodebytes(pending[:size]).replace(b"\n", b"\r\n")
+                pending = pending[size:]
+        if pending:
+            yield base64.encodebytes(pending).replace(b"\n", b"\r\n")
+
+
+# Write only stream collecting the output of ZipFile
+class ChunkStream(object):
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+# Escape the lines starting with a dot for the SMTP DATA command and add the terminating sequence, also when
+# the line break is split between two chunks
+def dot_stuff(chunks):
+    last = b"\n"
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if last == b"\n" and chunk.startswith(b"."):
+            chunk = b"." + chunk
+        elif last == b"\r" and chunk.startswith(b"\n."):
+            chunk = b"\n.." + chunk[2:]
+        chunk = chunk.replace(b"\r\n.", b"\r\n..")
+        last = chunk[-1:]
+        yield chunk
+    yield b".\r\n" if last == b"\n" else b"\r\n.\r\n"
+
+
+# Token bucket shared by the sending threads, allows rate messages per second with bursts of up to burst
+# messages (rate 0: no limit)
+class RateLimiter(object):
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Take a token, waiting for it if the bucket is empty
+    def wait(self):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # The token is reserved, waiting threads are served in order
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
 
 
 class SendEmail(object):
@@ -18,47 +155,178 @@ class SendEmail(object):
         self.password = settings["mail"]["credentials"]["password"]
         self.email_from = settings["mail"]["from"]
         self.email_to = settings["mail"]["to"]
+        # Compression of the attachments: "" (none), "gzip" or "zip"
+        self.compress = settings["mail"].get("compression") or None
+        # STARTTLS can be disabled and the login is skipped without username, e.g. for a local test server
+        self.starttls = settings["mail"]["smtp"].get("starttls", True)
+        # Messages sent over one session before reconnecting, servers usually limit them (0: no limit)
+        self.max_messages = int(settings["mail"]["smtp"].get("max_messages", 100))
+        # Seconds to wait for the server to connect and answer every command
+        self.timeout = float(settings["mail"]["smtp"].get("timeout", 60))
         self.check = None
+        self.conn = None
+        self.session_messages = 0
+        # Status of the last message: "OK" or the error returned by the server
+        self.status = None
 
     def check_smtp_server(self):
-        # Connect
-        conn = smtplib.SMTP(self.host, self.port)
+        # Connect, the session is kept open for the messages sent afterwards
+        if self.conn is None:
+            self.open()
         # Check SMTP server reachable and ready
-        self.check = conn.helo()
-        # Disconnect
-        conn.quit()
+        self.check = self.conn.noop()
         # Check result
         if self.check[0] != 250:
             return False
         else:
             return True
 
+    # Session mode: "with email:" connects, starts TLS and logs in once, every send() inside the block reuses
+    # the connection
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def connect(self):
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            conn.starttls()
+        if self.username:
+            conn.login(self.username, self.password)
+        return conn
+
+    def open(self):
+        if self.conn is not None:
+            return
+        self.conn = self.connect()
+        self.session_messages = 0
+
+    def close(self):
+        if self.conn is None:
+            return
+        try:
+            self.conn.quit()
+        except (smtplib.SMTPException, OSError):
+            self.conn.close()
+        self.conn = None
+
+    def reconnect(self):
+        self.close()
+        self.open()
+
     # https://stackoverflow.com/questions/3362600/how-to-send-email-attachments
-    def send(self, subject, body, attachment=None):
+    # Return the message as chunks of bytes with CRLF line endings. The attachment, a file path or an Attachment,
+    # is streamed: the MIME structure is built with a placeholder that is replaced by the encoded attachment
+    def build_message(self, subject, body, attachment=None, to=None):
         # Form the message content
         content = MIMEMultipart()
         content["Subject"] = subject
         content["From"] = self.email_from
-        content["To"] = self.email_to
+        content["To"] = to or self.email_to
         content['Date'] = formatdate(localtime=True)
-        content.attach(MIMEText(body, "html"))
+        content.attach(MIMEText(body, "html", "utf-8"))
         # Prepare attachment if present
+        placeholder = None
         if attachment:
+            if not isinstance(attachment, Attachment):
+                attachment = Attachment(os.path.basename(attachment), [attachment])
+            placeholder = uuid.uuid4().hex
             part = MIMEBase('application', "octet-stream")
-            with open(attachment, "rb") as f:
-                part.set_payload(f.read())
-            encoders.encode_base64(part)
-            part.add_header('Content-Disposition', 'attachment; filename=%s' % os.path.basename(attachment))
+            part.set_payload(placeholder)
+            part.add_header('Content-Transfer-Encoding', 'base64')
+            part.add_header('Content-Disposition', 'attachment; filename=%s' % attachment.name)
             content.attach(part)
+        message = content.as_bytes(policy=policy.compat32.clone(linesep="\r\n"))
+        if placeholder is None:
+            yield message
+            return
+        head, tail = message.split(placeholder.encode(), 1)
+        yield head
+        for chunk in attachment.base64_chunks():
+            yield chunk
+        yield tail
+
+    # Send a message through the DATA command of an open connection while it is built, returns the refused
+    # recipients like smtplib.SMTP.sendmail
+    def send_message(self, conn, to, chunks):
+        conn.ehlo_or_helo_if_needed()
+        code, response = conn.mail(self.username)
+        if code != 250:
+            conn.rset()
+            raise smtplib.SMTPSenderRefused(code, response, self.username)
+        recipients = [to] if isinstance(to, str) else to
+        refused = {}
+        for recipient in recipients:
+            code, response = conn.rcpt(recipient)
+            if code not in (250, 251):
+                refused[recipient] = (code, response)
+        if len(refused) == len(recipients):
+            conn.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        code, response = conn.docmd("data")
+        if code != 354:
+            conn.rset()
+            raise smtplib.SMTPDataError(code, response)
+        for chunk in dot_stuff(chunks):
+            conn.send(chunk)
+        code, response = conn.getreply()
+        if code != 250:
+            conn.rset()
+            raise smtplib.SMTPDataError(code, response)
+        return refused
+
+    # Send an email to the configured recipients or to the ones given, the attachment is a file path or an
+    # Attachment
+    def send(self, subject, body, attachment=None, to=None):
+        to = to or self.email_to
+        message = lambda: self.build_message(subject, body, attachment, to)
+        if self.conn is not None:
+            return self.send_on_session(message, to)
         # Send email
-        conn = smtplib.SMTP(self.host, self.port)
-        conn.starttls()
-        conn.login(self.username, self.password)
-        result = conn.sendmail(self.username, self.email_to, content.as_string())
+        conn = self.connect()
+        result = self.send_message(conn, to, message())
         # Disconnect
         conn.quit()
         # Check result
         if not len(result):
+            self.status = "OK"
             return True
         else:
+            self.status = "Refused recipients: %s" % result
             return False
+
+    # Send a message over the session, reconnecting when the server closed it or the session reached
+    # max_messages. message returns the chunks of the message, it is built again to retry.
+    # Returns True if the message was sent, the result is kept in self.status
+    def send_on_session(self, message, to):
+        if self.max_messages and self.session_messages >= self.max_messages:
+            self.reconnect()
+        for attempt in range(2):
+            try:
+                result = self.send_message(self.conn, to, message())
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                # Closed by the server, e.g. idle timeout or message limit, send again over a new session
+                self.status = "Disconnected: %s" % e
+                if attempt:
+                    return False
+                self.reconnect()
+                continue
+            except smtplib.SMTPResponseException as e:
+                self.status = "%s %s" % (e.smtp_code, e.smtp_error.decode("utf-8", "replace") if isinstance(e.smtp_error, bytes) else e.smtp_error)
+                # 421: service closing the session
+                if e.smtp_code == 421 and not attempt:
+                    self.reconnect()
+                    continue
+                return False
+            except smtplib.SMTPRecipientsRefused as e:
+                self.status = "Refused recipients: %s" % e.recipients
+                return False
+            self.session_messages += 1
+            if result:
+                self.status = "Refused recipients: %s" % result
+                return False
+            self.status = "OK"
+            return True
@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+
+import os
+import time
+import uuid
+import sqlite3
+
+# Fields of a parsed vulnerability alert, in output order
+alert_fields = ["timestamp", "rule_level", "rule_id", "agent_id", "agent_name", "agent_ip", "wazuh_node", "CVE", "description", "score", "severity", "package_name", "package_version", "package_condition"]
+
+# Alert status
+PENDING = 0
+SENDING = 1
+SENT = 2
+
+
+# The databases are written by the integration and the daemon (user ossec) and by the sender (root's cron), so they
+# are created 0660 with the group of their directory, the output dir. SQLite creates the "-wal" and "-shm" files with
+# the mode and owner of the database, existing ones are fixed too
+def prepare_database_file(path):
+    group = os.stat(os.path.dirname(os.path.abspath(path))).st_gid
+    if not os.path.exists(path):
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o660))
+    for file in (path, path + "-wal", path + "-shm"):
+        try:
+            stat = os.stat(file)
+            if stat.st_uid != os.geteuid() and os.geteuid() != 0:
+                continue
+            if stat.st_mode & 0o660 != 0o660:
+                os.chmod(file, (stat.st_mode | 0o660) & 0o7777)
+            if stat.st_gid != group:
+                os.chown(file, -1, group)
+        except (FileNotFoundError, PermissionError):
+            continue
+
+
+# Open a SQLite database in WAL mode, so the writers do not block the readers
+def open_database(path, timeout=60):
+    prepare_database_file(path)
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# SQLite (WAL mode) spool of parsed alerts, replacing the per agent files. Alerts are inserted in batched
+# transactions and claimed per agent by the sender, which marks them sent once the email is delivered.
+class AlertStore(object):
+
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.conn = open_database(path, timeout)
+        self.create_schema()
+
+    def create_schema(self):
+        columns = ", ".join("%s TEXT" % field for field in alert_fields)
+        self.conn.executescript("""
+            BEGIN;
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                %s,
+                status INTEGER NOT NULL DEFAULT 0,
+                batch TEXT,
+                created REAL NOT NULL,
+                sent REAL
+            );
+            CREATE INDEX IF NOT EXISTS alerts_status_agent ON alerts (status, agent_name);
+            CREATE INDEX IF NOT EXISTS alerts_agent_cve ON alerts (agent_id, CVE);
+            CREATE INDEX IF NOT EXISTS alerts_batch ON alerts (batch);
+            COMMIT;
+        """ % columns)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Insert parsed alerts in a single transaction
+    def insert_alerts(self, alerts):
+        now = time.time()
+        query = "INSERT INTO alerts (%s, created) VALUES (%s, ?)" % (", ".join(alert_fields), ", ".join("?" * len(alert_fields)))
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany(query, ([str(alert[field]) for field in alert_fields] + [now] for alert in alerts))
+        return len(alerts)
+
+    def pending_agents(self):
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT agent_name FROM alerts WHERE status = ?", (PENDING,))]
+
+    # Mark the pending alerts of an agent as being sent, returns the batch ID and the claimed alerts
+    def claim(self, agent_name):
+        batch = uuid.uuid4().hex
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("UPDATE alerts SET status = ?, batch = ? WHERE status = ? AND agent_name = ?", (SENDING, batch, PENDING, agent_name))
+        return batch, self.batch_alerts(batch)
+
+    def batch_alerts(self, batch):
+        query = "SELECT %s FROM alerts WHERE batch = ? ORDER BY id" % ", ".join(alert_fields)
+        return [dict(row) for row in self.conn.execute(query, (batch,))]
+
+    def mark_sent(self, batch):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("UPDATE alerts SET status = ?, sent = ? WHERE batch = ?", (SENT, time.time(), batch))
+
+    # Give the alerts of a batch back to the queue after a failed send
+    def release(self, batch):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("UPDATE alerts SET status = ?, batch = NULL WHERE batch = ?", (PENDING, batch))
+
+    # Give back the alerts of a sender that did not finish, to be run before claiming
+    def release_stale(self):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            return self.conn.execute("UPDATE alerts SET status = ?, batch = NULL WHERE status = ?", (PENDING, SENDING)).rowcount
+
+    # Delete the alerts sent more than retention_days ago
+    def purge_sent(self, retention_days):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            return self.conn.execute("DELETE FROM alerts WHERE status = ? AND sent < ?", (SENT, time.time() - retention_days * 86400)).rowcount
+
+
+# Findings already seen, keyed on (agent_id, CVE, package_name, package_version). The vulnerability detector
+# emits the same finding on every scan: only the first one is spooled and the next ones are counted as repeats
+# until the agent email is sent. Findings not seen for ttl_days are evicted and reported again when they return.
+class DedupIndex(object):
+
+    def __init__(self, path, ttl_days=7, timeout=60):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.conn = open_database(path, timeout)
+        self.create_schema()
+
+    def create_schema(self):
+        self.conn.executescript("""
+            BEGIN;
+            CREATE TABLE IF NOT EXISTS findings (
+                agent_id TEXT NOT NULL,
+                CVE TEXT NOT NULL,
+                package_name TEXT NOT NULL,
+                package_version TEXT NOT NULL,
+                agent_name TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                last_notified REAL,
+                repeats INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (agent_id, CVE, package_name, package_version)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS findings_agent ON findings (agent_name);
+            CREATE INDEX IF NOT EXISTS findings_last_seen ON findings (last_seen);
+            COMMIT;
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Record a batch of parsed alerts, returns the ones that are new findings. With spool, spool(new findings) is
+    # called before the commit and its result is returned: if it raises, the findings are rolled back so the alerts
+    # are not counted as repeats of findings that were never spooled
+    def filter_new(self, alerts, spool=None):
+        now = time.time()
+        new = []
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            for alert in alerts:
+                key = (str(alert["agent_id"]), str(alert["CVE"]), str(alert["package_name"]), str(alert["package_version"]))
+                row = self.conn.execute("SELECT last_seen FROM findings WHERE agent_id = ? AND CVE = ? AND package_name = ? AND package_version = ?", key).fetchone()
+                if row is not None and row[0] >= now - self.ttl:
+                    self.conn.execute("UPDATE findings SET last_seen = ?, repeats = repeats + 1 WHERE agent_id = ? AND CVE = ? AND package_name = ? AND package_version = ?", (now,) + key)
+                    continue
+                self.conn.execute("INSERT OR REPLACE INTO findings (agent_id, CVE, package_name, package_version, agent_name, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?)", key + (str(alert["agent_name"]), now, now))
+                new.append(alert)
+            if spool is not None:
+                return spool(new)
+        return new
+
+    # Findings of an agent seen again since its last email, as a list of (key, repeats)
+    def agent_repeats(self, agent_name):
+        query = "SELECT agent_id, CVE, package_name, package_version, repeats FROM findings WHERE agent_name = ? AND repeats > 0"
+        return [(tuple(row[:4]), row[4]) for row in self.conn.execute(query, (agent_name,))]
+
+    # Reset the repeats reported in the email of an agent, repeats counted meanwhile are kept for the next one
+    def mark_notified(self, agent_name, repeats):
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("UPDATE findings SET last_notified = ? WHERE agent_name = ?", (now, agent_name))
+            self.conn.executemany("UPDATE findings SET repeats = MAX(repeats - ?, 0) WHERE agent_id = ? AND CVE = ? AND package_name = ? AND package_version = ?", ((count,) + key for key, count in repeats))
+
+    # Delete the findings not seen for ttl_days
+    def evict(self):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            return self.conn.execute("DELETE FROM findings WHERE last_seen < ?", (time.time() - self.ttl,)).rowcount
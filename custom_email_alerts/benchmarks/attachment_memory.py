@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import traceback
+import tracemalloc
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email import encoders
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SendEmail import *
+
+# Peak memory of building an email with a large CSV attachment: the whole message built in memory with the email
+# package, as SendEmail did before, against the message streamed by SendEmail.build_message
+
+
+def in_memory(path):
+    content = MIMEMultipart()
+    content["Subject"] = "[Wazuh] CVEs in agent benchmark"
+    content.attach(MIMEText("<html><body>Benchmark</body></html>", "html"))
+    part = MIMEBase('application', "octet-stream")
+    with open(path, "rb") as f:
+        part.set_payload(f.read())
+    encoders.encode_base64(part)
+    part.add_header('Content-Disposition', 'attachment; filename=%s' % os.path.basename(path))
+    content.attach(part)
+    return len(content.as_string())
+
+
+def streamed(path, compress):
+    settings = {"mail": {"from": "Wazuh", "to": "benchmark@localhost", "credentials": {"username": "", "password": ""}, "smtp": {"host": "", "port": ""}}}
+    email = SendEmail(settings)
+    attachment = Attachment("benchmark.csv", [b'"Timestamp";"Rule level"\n', path], compress)
+    return sum(len(chunk) for chunk in dot_stuff(email.build_message("[Wazuh] CVEs in agent benchmark", "<html><body>Benchmark</body></html>", attachment)))
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.monotonic()
+    size = function(*args)
+    elapsed = time.monotonic() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of in memory and streamed email attachments.")
+    parser.add_argument('-s', '--size', action='store', type=int, default=50, help='Attachment size in MB (default: 50)')
+    args = parser.parse_args()
+
+    line = ('"2026-10-18T10:00:00.000+0000";"10";"23505";"001";"agent01";"10.0.0.1";"node01";"CVE-2026-0001";'
+            '"Vulnerability title";"7.5";"High";"package";"1.0";"Package less than 2.0"\n').encode()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "agent01.csv")
+        with open(path, "wb") as f:
+            for i in range(args.size * 1024 * 1024 // len(line)):
+                f.write(line)
+        print("Attachment of %.1f MB" % (os.path.getsize(path) / 1048576))
+        for name, function, extra in [("in memory", in_memory, ()), ("streamed", streamed, (None,)), ("streamed gzip", streamed, ("gzip",)), ("streamed zip", streamed, ("zip",))]:
+            size, elapsed, peak = measure(function, path, *extra)
+            print("%-14s message %8.1f MB  %6.2fs  peak memory %8.1f MB" % (name, size / 1048576, elapsed, peak / 1048576))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except SystemExit:
+        raise
+    except Exception:
+        print("Exception occurred:")
+        print(traceback.format_exc())
+        sys.exit(1)
@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cve_alerts
+
+# Per alert cost of parsing Wazuh vulnerability detector alerts: the previous path (json, re-serialization for the
+# log and full key walks) against load_alert() and parse_vulnerability_alert(), with json and with orjson when
+# it is installed. The corpus is generated or read from a file with one alert per line, e.g. alerts.json
+
+
+def sample_alert(i):
+    severity = random.choice(["Low", "Medium", "High", "Critical"])
+    cve = "CVE-2026-%05d" % random.randrange(100000)
+    package = "package%d" % random.randrange(500)
+    alert = {
+        "timestamp": "2026-10-18T10:%02d:%02d.000+0000" % (i // 60 % 60, i % 60),
+        "rule": {"level": 10, "description": "%s affects %s" % (cve, package), "id": "23505", "firedtimes": i, "mail": False,
+                 "groups": ["vulnerability-detector"], "gdpr": ["IV_35.7.d"], "pci_dss": ["11.2.1", "11.2.3"], "tsc": ["CC7.1", "CC7.2"]},
+        "agent": {"id": "%03d" % (i % 5000), "name": "agent%04d" % (i % 5000), "ip": "10.0.%d.%d" % (i % 5000 // 250, i % 250)},
+        "manager": {"name": "wazuh-manager"},
+        "id": "1697623200.%d" % i,
+        "cluster": {"name": "wazuh", "node": "node%02d" % (i % 3)},
+        "decoder": {"name": "json"},
+        "data": {"vulnerability": {
+            "package": {"name": package, "version": "1.%d.%d" % (i % 10, i % 7), "architecture": "amd64", "condition": "Package less than 2.0"},
+            "cvss": {"cvss2": {"vector": {"attack_vector": "network", "access_complexity": "low", "authentication": "none", "confidentiality_impact": "partial",
+                                          "integrity_impact": "partial", "availability": "partial"}, "base_score": "7.500000"},
+                     "cvss3": {"vector": {"attack_vector": "network", "access_complexity": "low", "privileges_required": "none", "user_interaction": "none",
+                                          "scope": "unchanged", "confidentiality_impact": "high", "integrity_impact": "none", "availability": "none"}, "base_score": "7.500000"}},
+            "cve": cve, "title": "%s affects %s" % (cve, package),
+            "rationale": "A flaw was found in %s. " % package * 8,
+            "severity": severity, "published": "2026-01-10", "updated": "2026-02-01", "cwe_reference": "CWE-787", "status": "Active", "type": "PACKAGE",
+            "references": ["https://nvd.nist.gov/vuln/detail/%s" % cve, "https://access.redhat.com/security/cve/%s" % cve],
+            "assigner": "cve@mitre.org", "cve_version": "4.0"}},
+        "location": "vulnerability-detector"
+    }
+    # Alerts without CVSS v3 score or agent IP
+    if i % 10 == 0:
+        del alert["data"]["vulnerability"]["cvss"]["cvss3"]
+    if i % 50 == 0:
+        del alert["agent"]["ip"]
+    return alert
+
+
+# Previous parser: json.load, json.dumps for the log and the nested lookups of every field
+def previous_parse(data):
+    alert = json.loads(data)
+    json.dumps(alert)
+    if "cvss" in alert["data"]["vulnerability"] and "cvss3" in alert["data"]["vulnerability"]["cvss"]:
+        score = alert["data"]["vulnerability"]["cvss"]["cvss3"]["base_score"]
+    else:
+        score = "-"
+    return {
+        "timestamp": alert["timestamp"],
+        "rule_level": str(alert["rule"]["level"]),
+        "rule_id": alert["rule"]["id"],
+        "agent_id": alert["agent"]["id"],
+        "agent_name": alert["agent"]["name"],
+        "agent_ip": alert["agent"]["ip"] if "ip" in alert["agent"] else "-",
+        "wazuh_node": alert["cluster"]["node"],
+        "CVE": alert["data"]["vulnerability"]["cve"],
+        "description": alert["data"]["vulnerability"]["title"],
+        "score": score,
+        "severity": alert["data"]["vulnerability"]["severity"],
+        "package_name": alert["data"]["vulnerability"]["package"]["name"],
+        "package_version": alert["data"]["vulnerability"]["package"]["version"],
+        "package_condition": alert["data"]["vulnerability"]["package"]["condition"]
+    }
+
+
+def current_parse(data):
+    return cve_alerts.parse_vulnerability_alert(cve_alerts.load_alert(data))
+
+
+def run(name, function, corpus, rounds):
+    best = None
+    for i in range(rounds):
+        start = time.perf_counter()
+        for data in corpus:
+            function(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("%-22s %8.2f us/alert  %10.0f alerts/s" % (name, best / len(corpus) * 1e6, len(corpus) / best))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per alert cost of the vulnerability alert parsers.")
+    parser.add_argument('-n', '--alerts', action='store', type=int, default=20000, help='Generated alerts (default: 20000)')
+    parser.add_argument('-c', '--corpus', action='store', help='File with one JSON alert per line instead of generated alerts')
+    parser.add_argument('-r', '--rounds', action='store', type=int, default=5, help='Rounds, the best one is reported (default: 5)')
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, "rb") as f:
+            corpus = [line for line in f if b'"vulnerability"' in line]
+    else:
+        random.seed(1)
+        corpus = [json.dumps(sample_alert(i)).encode() for i in range(args.alerts)]
+    print("%s alerts, %.0f bytes per alert" % (len(corpus), sum(len(data) for data in corpus) / len(corpus)))
+
+    # Both parsers have to project the same fields
+    for data in corpus[:1000]:
+        assert previous_parse(data) == current_parse(data), data
+
+    run("previous (json)", previous_parse, corpus, args.rounds)
+    orjson = cve_alerts.orjson
+    cve_alerts.orjson = None
+    run("load_alert (json)", current_parse, corpus, args.rounds)
+    cve_alerts.orjson = orjson
+    if orjson is not None:
+        run("load_alert (orjson)", current_parse, corpus, args.rounds)
+    else:
+        print("orjson is not installed")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except SystemExit:
+        raise
+    except Exception:
+        print("Exception occurred:")
+        print(traceback.format_exc())
+        sys.exit(1)
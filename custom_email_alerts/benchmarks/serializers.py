@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import time
+import random
+import argparse
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from alert_store import alert_fields
+from serializers import *
+
+# Throughput of the spool line serializers against the previous string concatenation, and round trip check of
+# values with quotes, separators, markup and line breaks
+
+
+def previous_csv(info):
+    return '"' + info['timestamp'] + '";"' + info['rule_level'] + '";"' + info['rule_id'] + '";"' + info['agent_id'] + '";"' + info['agent_name'] + '";"' + info['agent_ip'] + '";"' + info['wazuh_node'] + '";"' + info['CVE'] + '";"' + info['description'] + '";"' + info['score'] + '";"' + info['severity'] + '";"' + info['package_name'] + '";"' + info['package_version'] + '";"' + info['package_condition'] + '"'
+
+
+def previous_html(info):
+    return "<tr><td>" + info["timestamp"] + "</td><td>" + info["rule_level"] + "</td><td>" + info["rule_id"] + "</td><td>" + info["agent_id"] + "</td><td>" + info["agent_name"] + "</td><td>" + info["agent_ip"] + "</td><td>" + info["wazuh_node"] + "</td><td>" + info["CVE"] + "</td><td>" + info["description"] + "</td><td>" + info["score"] + "</td><td>" + info["severity"] + "</td><td>" + info["package_name"] + "</td><td>" + info["package_version"] + "</td><td>" + info["package_condition"] + "</td></tr>"
+
+
+def sample_info(i):
+    info = {field: "%s-%d" % (field, i) for field in alert_fields}
+    info["description"] = random.choice(['Buffer overflow in "libfoo"; remote code execution', "Use after free in <script> parsing & rendering", "Plain title", "Multi\nline\r\ntitle"])
+    info["severity"] = random.choice(["Low", "Medium", "High", "Critical"])
+    return info
+
+
+def run(name, function, infos, rounds):
+    best = None
+    for i in range(rounds):
+        start = time.perf_counter()
+        for info in infos:
+            function(info)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("%-16s %8.2f us/record  %10.0f records/s" % (name, best / len(infos) * 1e6, len(infos) / best))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the spool line serializers.")
+    parser.add_argument('-n', '--records', action='store', type=int, default=50000, help='Records (default: 50000)')
+    parser.add_argument('-r', '--rounds', action='store', type=int, default=5, help='Rounds, the best one is reported (default: 5)')
+    args = parser.parse_args()
+
+    random.seed(1)
+    infos = [sample_info(i) for i in range(args.records)]
+
+    # Every value has to come back from its line, without the line breaks
+    for format, serializer in serializers.items():
+        for info in infos[:1000]:
+            line = serializer.line(info)
+            assert "\n" not in line and "\r" not in line, (format, line)
+            values = serializer.parse(line)
+            expected = [info[field].replace("\r\n", " ").replace("\n", " ") for field in alert_fields]
+            assert values == expected, (format, values, expected)
+    print("Round trip of %s formats OK" % len(serializers))
+
+    run("previous csv", previous_csv, infos, args.rounds)
+    run("previous html", previous_html, infos, args.rounds)
+    for format, serializer in serializers.items():
+        run(format, serializer.line, infos, args.rounds)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except SystemExit:
+        raise
+    except Exception:
+        print("Exception occurred:")
+        print(traceback.format_exc())
+        sys.exit(1)
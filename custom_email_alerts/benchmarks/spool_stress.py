@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+import tempfile
+import traceback
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utilities import *
+
+# Stress test of the spool files: many writer processes append records to a few agent files while a consumer
+# claims and removes them, as custom-cve-email-alerts and send-custom-cve-email-alerts do. Every record written
+# has to be consumed exactly once and intact.
+
+
+def writer(directory, writer_id, records, agents, record_size):
+    padding = "x" * record_size
+    for i in range(records):
+        agent = "agent%03d" % random.randrange(agents)
+        save_file_to_disk("%s;%s;%s;%s" % (writer_id, i, padding, agent), os.path.join(directory, agent + ".csv"))
+
+
+def consume(directory, seen):
+    errors = 0
+    for file in claim_spool_files(directory, ".csv"):
+        path = os.path.join(directory, file)
+        agent = file[:-len(".csv.sending")]
+        for line in read_text_file(path).splitlines():
+            fields = line.split(";")
+            if len(fields) != 4 or fields[3] != agent:
+                errors += 1
+                continue
+            key = (fields[0], fields[1])
+            if key in seen:
+                errors += 1
+            seen.add(key)
+        os.remove(path)
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress test of concurrent appends and claims of the spool files.")
+    parser.add_argument('-w', '--writers', action='store', type=int, default=200, help='Writer processes (default: 200)')
+    parser.add_argument('-r', '--records', action='store', type=int, default=200, help='Records written by every writer (default: 200)')
+    parser.add_argument('-a', '--agents', action='store', type=int, default=10, help='Agent spool files (default: 10)')
+    parser.add_argument('-s', '--record-size', action='store', type=int, default=300, help='Bytes of padding of every record (default: 300)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        seen = set()
+        result = {"errors": 0, "claims": 0}
+        done = threading.Event()
+
+        # Claim the spool files continuously while the writers are running
+        def consumer():
+            while not done.is_set():
+                result["errors"] += consume(directory, seen)
+                result["claims"] += 1
+
+        # Fresh processes from a fork server, forking this process would copy the locks held by the consumer
+        context = multiprocessing.get_context("forkserver")
+        writers = [context.Process(target=writer, args=(directory, "w%d" % i, args.records, args.agents, args.record_size)) for i in range(args.writers)]
+        start = time.monotonic()
+        thread = threading.Thread(target=consumer)
+        thread.start()
+        for process in writers:
+            process.start()
+        for process in writers:
+            process.join()
+        done.set()
+        thread.join()
+        errors = result["errors"] + consume(directory, seen)
+        claims = result["claims"]
+        elapsed = time.monotonic() - start
+
+    expected = args.writers * args.records
+    print("%s writers, %s records, %s claim rounds in %.2fs (%.0f records/s)" % (args.writers, expected, claims, elapsed, expected / elapsed))
+    print("Consumed %s records, %s missing, %s corrupted or duplicated" % (len(seen), expected - len(seen), errors))
+    if len(seen) != expected or errors:
+        print("FAILED")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except SystemExit:
+        raise
+    except Exception:
+        print("Exception occurred:")
+        print(traceback.format_exc())
+        sys.exit(1)
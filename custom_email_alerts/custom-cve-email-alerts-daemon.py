@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+
+import sys
+import json
+import time
+import queue
+import signal
+import threading
+import traceback
+import socketserver
+from utilities import *
+from cve_alerts import *
+
+# Long running process that receives the alerts from the integration script through a Unix socket and saves them
+# in batches, avoiding the process spawn of every alert. The integration falls back to save the alert by itself
+# when the daemon is not running.
+# This script must have 750 permissions with user "root" and group "ossec" as owners: "-rwxr-x--- root ossec"
+# and has to be run as the "ossec" user so the integration can connect to the socket, e.g. from a systemd service:
+#   ExecStart=/var/ossec/integrations/custom-cve-email-alerts-daemon
+#   User=ossec
+# Log file path
+log_file = os.path.join(output, "custom-cve-email-alerts-daemon.log")
+# Log level, DEBUG also logs every received alert
+set_log_level(INFO)
+# Maximum alerts saved in one batch
+batch_size = 500
+# Seconds to wait for more alerts before saving a batch
+batch_timeout = 1
+# Maximum alerts waiting to be saved, the integration falls back to save the alert by itself when it is full
+queue_size = 100000
+# Attempts to save a batch, waiting save_retry_delay seconds after the first failure and doubling it after each one
+save_attempts = 3
+save_retry_delay = 1
+# The alerts of a batch that could not be saved are kept in this file, one JSON per line, and saved again when the
+# daemon starts. The integration already got "OK" for them, so they must never be discarded
+pending_file = os.path.join(output, "custom-cve-email-alerts-daemon.pending")
+
+alerts_queue = queue.Queue(maxsize=queue_size)
+
+
+class AlertHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        data = self.rfile.read()
+        if not data:
+            return
+        try:
+            alerts_queue.put_nowait(data)
+        except queue.Full:
+            self.wfile.write(b"FULL\n")
+            return
+        self.wfile.write(b"OK\n")
+
+
+class AlertServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+# Get up to batch_size alerts, waiting at most batch_timeout for the batch to fill
+def get_batch():
+    batch = [alerts_queue.get()]
+    deadline = time.monotonic() + batch_timeout
+    while len(batch) < batch_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(alerts_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+# Save a batch of alerts retrying with backoff, if every attempt fails the alerts are written to the pending file
+def save_batch(alerts):
+    for attempt in range(save_attempts):
+        try:
+            agents = save_alerts(alerts)
+            log("  [-] Processed %s alerts, new findings of %s agents" % (len(alerts), agents), log_file)
+            return True
+        except Exception:
+            log("  [X] Error saving a batch of %s alerts, attempt %s of %s:\n%s" % (len(alerts), attempt + 1, save_attempts, traceback.format_exc()),
+                log_file, ERROR)
+        if attempt + 1 < save_attempts:
+            time.sleep(save_retry_delay * 2 ** attempt)
+    try:
+        spool_append(pending_file, "\n".join(json.dumps(alert) for alert in alerts))
+        log("  [!] Kept %s alerts in %s, they will be saved when the daemon restarts" % (len(alerts), pending_file), log_file, WARNING)
+    except Exception:
+        log("  [X] Lost a batch of %s alerts, could not write %s:\n%s" % (len(alerts), pending_file, traceback.format_exc()), log_file, ERROR)
+    return False
+
+
+# Save the alerts left in the pending file by a previous run
+def save_pending_alerts():
+    sending = spool_claim(pending_file)
+    if sending is None:
+        return
+    with open(sending, "rb") as f:
+        lines = [line for line in f.read().split(b"\n") if line.strip()]
+    log("  [*] Saving %s pending alerts of a previous run" % len(lines), log_file)
+    alerts = []
+    for line in lines:
+        try:
+            alerts.append(load_alert(line))
+        except ValueError:
+            log("  [X] Discarding pending alert, invalid JSON: %s" % line[:200], log_file, WARNING)
+    for i in range(0, len(alerts), batch_size):
+        save_batch(alerts[i:i + batch_size])
+    # The batches that failed again are back in the pending file
+    os.remove(sending)
+
+
+# Save the queued alerts until the None sentinel is received
+def process_alerts():
+    save_pending_alerts()
+    running = True
+    while running:
+        batch = get_batch()
+        if None in batch:
+            batch.remove(None)
+            running = False
+        alerts = []
+        for data in batch:
+            try:
+                alerts.append(load_alert(data))
+            except ValueError:
+                log("  [X] Discarding alert, invalid JSON: %s" % data[:200], log_file, WARNING)
+                continue
+            if is_log_enabled(DEBUG):
+                log("  [-] Alert json: %s" % data.decode("utf-8", "replace"), log_file, DEBUG)
+        if not alerts:
+            continue
+        save_batch(alerts)
+
+
+def main():
+    # check if output dir exists
+    if not os.path.exists(output):
+        log("[X] Exiting, directory \"" + output + "\" does not exist!", log_file, ERROR)
+        sys.exit(1)
+
+    # Remove the socket of a previous run
+    if os.path.exists(socket_file):
+        os.remove(socket_file)
+    server = AlertServer(socket_file, AlertHandler)
+    os.chmod(socket_file, 0o660)
+    log("  [*] Listening on %s using format %s" % (socket_file, output_format), log_file)
+
+    worker = threading.Thread(target=process_alerts)
+    worker.start()
+    # Stop accepting alerts on SIGTERM/SIGINT, the queued alerts are saved before exiting
+    stop = lambda signum, frame: threading.Thread(target=server.shutdown).start()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_file)
+        alerts_queue.put(None)
+        worker.join()
+        log("[-] Daemon stopped at " + get_time_now(), log_file)
+
+
+if __name__ == "__main__":
+    log("[+] Daemon started at " + get_time_now(), log_file)
+    try:
+        main()
+    except Exception:
+        log("[X] Exiting, an error occurred:\n" + traceback.format_exc(), log_file, ERROR)
+        raise
@@ -2,48 +2,39 @@
 
 import sys
 import json
+import socket
 import traceback
 from utilities import *
+from cve_alerts import *
 
-# Output dir has to be created manually and requires 770 permissions with user "root" and group "ossec" as owners: "drwxrwx--- root ossec"
 # This script must have 750 permissions with user "root" and group "ossec" as owners:: "-rwxr-x--- root ossec"
-output = "/var/ossec/integrations/custom-cve-email-alerts_output"
-# debug output
-# output = R""
+# Output dir, format and daemon socket are set in cve_alerts.py
 # Log file path
 log_file = os.path.join(output, "custom-cve-email-alerts.log")
-# Output format
-output_format = "csv"
+# Log level, DEBUG also logs the full JSON of every alert
+set_log_level(INFO)
+# Seconds to wait for the alerts daemon
+daemon_timeout = 5
 
 
-def parse_vulnerability_alert(file):
-    log("  [-] Parsing alert at \"" + file + "\"", log_file)
-    # read json file
-    with open(file) as f:
-        alert = json.load(f)
-    log("  [-] Alert json: " + json.dumps(alert), log_file)
-    # parse json fields
-    # check if "cvss" field exists
-    if "cvss" in alert["data"]["vulnerability"]:
-        score = alert["data"]["vulnerability"]["cvss"]["cvss3"]["base_score"]
-    else:
-        score = "-"
-    return {
-        "timestamp": alert["timestamp"],
-        "rule_level": str(alert["rule"]["level"]),
-        "rule_id": alert["rule"]["id"],
-        "agent_id": alert["agent"]["id"],
-        "agent_name": alert["agent"]["name"],
-        "agent_ip": alert["agent"]["ip"],
-        "wazuh_node": alert["cluster"]["node"],
-        "CVE": alert["data"]["vulnerability"]["cve"],
-        "description": alert["data"]["vulnerability"]["title"],
-        "score": score,
-        "severity": alert["data"]["vulnerability"]["severity"],
-        "package_name": alert["data"]["vulnerability"]["package"]["name"],
-        "package_version": alert["data"]["vulnerability"]["package"]["version"],
-        "package_condition": alert["data"]["vulnerability"]["package"]["condition"]
-    }
+# Hand the alert to the alerts daemon, returns False if the daemon is not running
+def send_to_daemon(alert_file):
+    with open(alert_file, "rb") as f:
+        data = f.read()
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(daemon_timeout)
+        conn.connect(socket_file)
+    except (OSError, socket.timeout):
+        return False
+    try:
+        conn.sendall(data)
+        conn.shutdown(socket.SHUT_WR)
+        return conn.recv(16).startswith(b"OK")
+    except (OSError, socket.timeout):
+        return False
+    finally:
+        conn.close()
 
 
 def main(args):
@@ -54,31 +45,34 @@ def main(args):
 
     # check if output dir exists
     if not os.path.exists(output):
-        log("[X] Exiting, directory \"" + output + "\" does not exist!", log_file)
+        log("[X] Exiting, directory \"" + output + "\" does not exist!", log_file, ERROR)
         sys.exit(1)
         # os.mkdir(output_dir, mode=700)
 
+    # Hand the alert to the daemon when it is running
+    if send_to_daemon(alert_file):
+        log("  [-] Alert queued on the alerts daemon", log_file)
+        return
+
     # Parse alert and save the html table column
-    info = parse_vulnerability_alert(alert_file)
+    log("  [-] Parsing alert at \"" + alert_file + "\"", log_file)
+    alert = read_alert(alert_file)
+    if is_log_enabled(DEBUG):
+        log("  [-] Alert json: " + json.dumps(alert), log_file, DEBUG)
     log("  [-] Using format %s" % output_format, log_file)
-    if output_format == "html":
-        html_content = "<tr><td>" + info["timestamp"] + "</td><td>" + info["rule_level"] + "</td><td>" + info["rule_id"] + "</td><td>" + info["agent_id"] + "</td><td>" + info["agent_name"] + "</td><td>" + info["agent_ip"] + "</td><td>" + info["wazuh_node"] + "</td><td>" + info["CVE"] + "</td><td>" + info["description"] + "</td><td>" + info["score"] + "</td><td>" + info["severity"] + "</td><td>" + info["package_name"] + "</td><td>" + info["package_version"] + "</td><td>" + info["package_condition"] + "</td></tr>"
-        save_file_to_disk(html_content, os.path.join(output, info["agent_name"] + ".html"))
-    elif output_format == "csv":
-        csv_content = '"' + info['timestamp'] + '";"' + info['rule_level'] + '";"' + info['rule_id'] + '";"' + info['agent_id'] + '";"' + info['agent_name'] + '";"' + info['agent_ip'] + '";"' + info['wazuh_node'] + '";"' + info['CVE'] + '";"' + info['description'] + '";"' + info['score'] + '";"' + info['severity'] + '";"' + info['package_name'] + '";"' + info['package_version'] + '";"' + info['package_condition'] + '"'
-        save_file_to_disk(csv_content, os.path.join(output, info["agent_name"] + ".csv"))
-    else:
-        log("  [X] Exiting, output format '%s' not identified" % output_format, log_file)
+    if output_format not in serializers:
+        log("  [X] Exiting, output format '%s' not identified" % output_format, log_file, ERROR)
         sys.exit(1)
+    save_alerts([alert])
 
 
 if __name__ == "__main__":
     log("[+] Script started at " + get_time_now(), log_file)
     try:
         if len(sys.argv) < 4:
-            log("[X] Exiting: bad arguments. Received " + str(len(sys.argv)) + " arguments.", log_file)
+            log("[X] Exiting: bad arguments. Received " + str(len(sys.argv)) + " arguments.", log_file, ERROR)
             sys.exit(1)
         main(sys.argv)
     except Exception:
-        log("[X] Exiting, an error occurred:\n" + traceback.format_exc(), log_file)
+        log("[X] Exiting, an error occurred:\n" + traceback.format_exc(), log_file, ERROR)
         raise
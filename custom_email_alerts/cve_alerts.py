@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+
+import os
+import json
+from utilities import *
+from alert_store import AlertStore, DedupIndex, alert_fields
+from serializers import get_serializer, serializers
+
+# orjson parses the alerts faster when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Output dir has to be created manually and requires 770 permissions with user "root" and group "ossec" as owners: "drwxrwx--- root ossec"
+output = "/var/ossec/integrations/custom-cve-email-alerts_output"
+# debug output
+# output = R""
+# Output format: "csv", "html" or "jsonl"
+output_format = "csv"
+# Unix socket of the alerts daemon
+socket_file = os.path.join(output, "custom-cve-email-alerts.sock")
+# Spool backend: "file" saves one file per agent, "sqlite" saves the alerts in a SQLite database
+spool_backend = "file"
+# SQLite spool database, created on first use. The integration and the sender have to be able to write it and
+# its "-wal" and "-shm" files, created with the permissions of the output dir owners
+spool_db = os.path.join(output, "custom-cve-email-alerts.db")
+# Days to keep the alerts already sent in the SQLite spool
+spool_retention_days = 7
+# Spool only the first alert of every agent/CVE/package finding, the next ones are counted as repeats
+dedup_enabled = True
+# SQLite database of the findings already seen
+dedup_db = os.path.join(output, "custom-cve-email-alerts-dedup.db")
+# Days a finding is remembered after it was last seen, it is reported again if it comes back later
+dedup_ttl_days = 7
+
+alert_store = None
+dedup_index = None
+
+
+# Decode a JSON alert from bytes or str
+def load_alert(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def read_alert(file):
+    with open(file, "rb") as f:
+        return load_alert(f.read())
+
+
+# Project the alert to the fields sent by email
+def parse_vulnerability_alert(alert):
+    rule = alert["rule"]
+    agent = alert["agent"]
+    vulnerability = alert["data"]["vulnerability"]
+    package = vulnerability["package"]
+    # The CVSS v3 score and the agent IP are missing in some alerts
+    cvss3 = vulnerability.get("cvss", {}).get("cvss3")
+    score = cvss3.get("base_score", "-") if cvss3 else "-"
+    return {
+        "timestamp": alert["timestamp"],
+        "rule_level": str(rule["level"]),
+        "rule_id": rule["id"],
+        "agent_id": agent["id"],
+        "agent_name": agent["name"],
+        "agent_ip": agent.get("ip", "-"),
+        "wazuh_node": alert["cluster"]["node"],
+        "CVE": vulnerability["cve"],
+        "description": vulnerability["title"],
+        "score": str(score),
+        "severity": vulnerability["severity"],
+        "package_name": package["name"],
+        "package_version": package["version"],
+        "package_condition": package["condition"]
+    }
+
+
+# Return the output file and the line of a parsed alert
+def format_alert(info, format=output_format):
+    serializer = get_serializer(format)
+    return os.path.join(output, info["agent_name"] + serializer.extension), serializer.line(info)
+
+
+# Parse a line of a spool file back to the fields of the alert, the reverse of format_alert
+def parse_spool_line(line, format=output_format):
+    values = get_serializer(format).parse(line)
+    if len(values) != len(alert_fields):
+        raise ValueError("invalid spool line: %s" % line[:200])
+    return dict(zip(alert_fields, values))
+
+
+# Open the SQLite spool once per process
+def get_alert_store():
+    global alert_store
+    if alert_store is None:
+        alert_store = AlertStore(spool_db)
+    return alert_store
+
+
+def get_dedup_index():
+    global dedup_index
+    if dedup_index is None:
+        dedup_index = DedupIndex(dedup_db, dedup_ttl_days)
+    return dedup_index
+
+
+# Parse a batch of alerts and save the new findings in the spool. The findings are recorded in the dedup index only
+# once the spool write succeeded. Returns the number of agents with new findings
+def save_alerts(alerts, format=output_format):
+    infos = [parse_vulnerability_alert(alert) for alert in alerts]
+    if dedup_enabled:
+        return get_dedup_index().filter_new(infos, lambda new: spool_alerts(new, format))
+    return spool_alerts(infos, format)
+
+
+# Save parsed alerts in the spool, one write per output file or one transaction for the whole batch. Returns the
+# number of agents
+def spool_alerts(infos, format=output_format):
+    if not infos:
+        return 0
+    if spool_backend == "sqlite":
+        get_alert_store().insert_alerts(infos)
+        return len(set(info["agent_name"] for info in infos))
+    files = {}
+    for info in infos:
+        file, line = format_alert(info, format)
+        files.setdefault(file, []).append(line)
+    for file, lines in files.items():
+        save_file_to_disk("\n".join(lines), file)
+    return len(files)
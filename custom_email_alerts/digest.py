@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+import io
+import os
+import csv
+import html
+import zipfile
+import fnmatch
+from alert_store import alert_fields
+from serializers import field_titles
+
+# Severities in report order, unknown severities go last
+severity_order = ["Critical", "High", "Medium", "Low"]
+# Alerts written to the Parquet file at once
+parquet_batch_size = 10000
+
+
+def severity_rank(severity):
+    return severity_order.index(severity) if severity in severity_order else len(severity_order)
+
+
+# Return the team of an agent: the first team with a matching agent name pattern, None if there is no match.
+# Teams are dictionaries with a "name", the "to" recipients and the "agents" patterns, e.g. ["web-*", "db-??"]
+def route_agent(agent_name, teams):
+    for team in teams:
+        for pattern in team.get("agents", []):
+            if fnmatch.fnmatch(agent_name, pattern):
+                return team
+    return None
+
+
+# Consolidated report of the alerts of many agents: the alerts are streamed to a compressed attachment, a zipped
+# CSV or a Parquet file, while a summary of the CVEs found is kept in memory
+class DigestWriter(object):
+
+    def __init__(self, path, format="zip"):
+        self.format = format
+        self.alerts = 0
+        self.agents = set()
+        # (severity, CVE) => [description, agents, alerts]
+        self.cves = {}
+        if format == "zip":
+            self.path = path + ".zip"
+            self.zip = zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED)
+            self.stream = io.TextIOWrapper(self.zip.open(os.path.basename(path) + ".csv", "w"), encoding="utf-8", newline="")
+            self.writer = csv.writer(self.stream, delimiter=";", quoting=csv.QUOTE_ALL)
+            # Same column titles as the CSV attachments of the agents
+            self.writer.writerow(field_titles)
+        elif format == "parquet":
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise RuntimeError("pyarrow is required to write the Parquet digest %s" % path)
+            self.path = path + ".parquet"
+            self.pyarrow = pyarrow
+            self.schema = pyarrow.schema([(field, pyarrow.string()) for field in alert_fields])
+            self.writer = pyarrow.parquet.ParquetWriter(self.path, self.schema, compression="zstd")
+            self.batch = []
+        else:
+            raise ValueError("digest format '%s' not identified" % format)
+
+    def add(self, info):
+        self.alerts += 1
+        self.agents.add(info["agent_name"])
+        cve = self.cves.get((info["severity"], info["CVE"]))
+        if cve is None:
+            cve = self.cves[(info["severity"], info["CVE"])] = [info["description"], set(), 0]
+        cve[1].add(info["agent_name"])
+        cve[2] += 1
+        if self.format == "zip":
+            self.writer.writerow([info[field] for field in alert_fields])
+        else:
+            self.batch.append(info)
+            if len(self.batch) >= parquet_batch_size:
+                self.write_batch()
+
+    def write_batch(self):
+        if self.batch:
+            self.writer.write_table(self.pyarrow.Table.from_pylist(self.batch, schema=self.schema))
+            self.batch = []
+
+    def close(self):
+        if self.format == "zip":
+            self.stream.close()
+            self.zip.close()
+        else:
+            self.write_batch()
+            self.writer.close()
+
+    # HTML table of the CVEs by severity, with the number of agents and alerts, up to max_rows rows
+    def summary_html(self, max_rows=500):
+        rows = sorted(self.cves.items(), key=lambda item: (severity_rank(item[0][0]), -len(item[1][1]), item[0][1]))
+        content = "<table class='customTable'><thead><tr><th>Severity</th><th>CVE</th><th>Description</th><th>Agents</th><th>Alerts</th></tr></thead><tbody>"
+        for (severity, cve), (description, agents, alerts) in rows[:max_rows]:
+            content += "<tr><td>%s</td><td>%s</td><td>%s</td><td>%s</td><td>%s</td></tr>" % (html.escape(severity), html.escape(cve), html.escape(description), len(agents), alerts)
+        content += "</tbody></table>"
+        if len(rows) > max_rows:
+            content += "<p>%s more CVEs in the attachment.</p>" % (len(rows) - max_rows)
+        return content
+
+    # Alerts by severity, e.g. "Critical: 10, High: 25"
+    def severity_totals(self):
+        totals = {}
+        for (severity, cve), (description, agents, alerts) in self.cves.items():
+            totals[severity] = totals.get(severity, 0) + alerts
+        return ", ".join("%s: %s" % (severity, totals[severity]) for severity in sorted(totals, key=severity_rank))
@@ -19,11 +19,12 @@ chmod 770 $output
 chown root:ossec $output
 
 echo "[-] Changing file permissions"
-chmod 750 $integrations/utilities.py $integrations/SendEmail.py $integrations/send-custom-cve-email-alerts.py $integrations/send-custom-cve-email-alerts_settings.json $integrations/custom-cve-email-alerts.py
-chown root:ossec $integrations/utilities.py $integrations/SendEmail.py $integrations/send-custom-cve-email-alerts.py $integrations/send-custom-cve-email-alerts_settings.json $integrations/custom-cve-email-alerts.py
+chmod 750 $integrations/utilities.py $integrations/cve_alerts.py $integrations/alert_store.py $integrations/digest.py $integrations/serializers.py $integrations/SendEmail.py $integrations/send-custom-cve-email-alerts.py $integrations/send-custom-cve-email-alerts_settings.json $integrations/custom-cve-email-alerts.py $integrations/custom-cve-email-alerts-daemon.py
+chown root:ossec $integrations/utilities.py $integrations/cve_alerts.py $integrations/alert_store.py $integrations/digest.py $integrations/serializers.py $integrations/SendEmail.py $integrations/send-custom-cve-email-alerts.py $integrations/send-custom-cve-email-alerts_settings.json $integrations/custom-cve-email-alerts.py $integrations/custom-cve-email-alerts-daemon.py
 
 echo "[-] Renaming integration file"
 mv $integrations/custom-cve-email-alerts.py $integrations/custom-cve-email-alerts
+mv $integrations/custom-cve-email-alerts-daemon.py $integrations/custom-cve-email-alerts-daemon
 
 echo "[!] Check files are correct!"
 ls -la $integrations
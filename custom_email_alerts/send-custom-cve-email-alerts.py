@@ -1,9 +1,16 @@
 #!/usr/bin/python3
 
+import re
 import sys
+import html
+import time
+import queue
 import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 from utilities import *
+from cve_alerts import *
 from SendEmail import *
+from digest import *
 
 # Input dir has to be created manually and requires 770 permissions with user "root" and group "ossec" as owners: "drwxrwx--- root ossec"
 # This script must have 750 permissions with user "root" and group "ossec" as owners: "-rwxr-x--- root ossec"
@@ -18,22 +25,239 @@ output_tmp = "/tmp"
 log_file = os.path.join(input_dir, "send-custom-cve-email-alerts.log")
 # Configuration file path, must have 640 permissions with user "root" and group "ossec" as owners
 conf_file = os.path.join(get_script_path_from_args(sys.argv[0]), "send-custom-cve-email-alerts_settings.json")
-# Input format
+# Input format: "csv", "html" or "jsonl"
 input_format = "csv"
+# The spool backend and database are set in cve_alerts.py
 
 # Format strings
 subject_header = "[Wazuh] CVEs in agent "
-# CSV
-csv_header = '"Timestamp";"Rule level";"Rule ID";"Agent ID";"Agent name";"Agent IP";"Wazuh node";"CVE";"Description";"Score";"Severity";"Package name";"Package version";"Package condition"\n'
 # HTML
 html_css_style = "*{font-family:'Segoe UI';}table.customTable{width:100%;background-color:#FFFFFF;border-collapse:collapse;border-width:2px;border-color:#04508c;border-style:solid;color:#000000;}table.customTable td,table.customTable th{border-width:2px;border-color:#04508c;border-style:solid;padding:5px;}table.customTable thead{background-color:#04508c;color:#ffffff;}"
 html_header = "<html><header><style>"+html_css_style+"</style></header><body>"
 html_body = "Found CVEs in agent <b>XXAGENTXX</b>."
-html_table_header = "<table class='customTable'><thead><tr><th>Timestamp</th><th>Rule level</th><th>Rule ID</th><th>Agent ID</th><th>Agent name</th><th>Agent IP</th><th>Wazuh node</th><th>CVE</th><th>Description</th><th>Score</th><th>Severity</th><th>Package name</th><th>Package version</th><th>Package condition</th></tr></thead><tbody>"
+html_repeats = " <b>%s</b> known findings were detected again %s times since the last report."
+html_table_header = serializers["html"].header()
 html_table_footer = "</tbody></table>"
+html_digest_body = "Found CVEs in <b>%s</b> agents (%s alerts, %s). The alerts are in the attachment file."
+digest_subject_header = "[Wazuh] CVE digest"
 html_footer = "</body></html>"
 
 
+# Spooled lines of an agent, parts are bytes or paths of spool files
+def read_parts(parts):
+    return "".join(part.decode("utf-8") if isinstance(part, bytes) else read_text_file(part) for part in parts)
+
+
+def iter_part_lines(parts):
+    for part in parts:
+        if isinstance(part, bytes):
+            for line in part.decode("utf-8").splitlines():
+                yield line
+            continue
+        with open(part, "r") as f:
+            for line in f:
+                yield line.rstrip("\n")
+
+
+# Send the email of an agent with its spooled lines and the count of repeated findings, returns True if the
+# email was sent. The CSV and JSONL attachments are streamed from the spool parts
+def send_agent_email(email, agent_name, parts, repeats=()):
+    subject = subject_header + agent_name
+    body = html_body.replace("XXAGENTXX", html.escape(agent_name))
+    if repeats:
+        body += html_repeats % (len(repeats), sum(count for key, count in repeats))
+    if input_format == "html":  # HTML
+        # Form the HTML body
+        html_content = html_header
+        html_content += body
+        html_content += html_table_header
+        html_content += read_parts(parts)
+        html_content += html_footer
+        return email.send(subject, html_content)
+    # CSV, JSONL
+    # Form the HTML content
+    html_content = html_header
+    html_content += body + " Please take a look at the attachment file."
+    html_content += html_footer
+    # Form the attachment: header and spooled lines
+    serializer = get_serializer(input_format)
+    header = serializer.header()
+    if header:
+        parts = [header.encode("utf-8")] + parts
+    attachment = Attachment(agent_name + serializer.extension, parts, email.compress)
+    return email.send(subject, html_content, attachment)
+
+
+# Send the emails of the agents over a pool of SMTP sessions, one per worker thread, at most rate_limit emails
+# per second in total. Jobs are (agent name, spool parts, result callback) tuples: the spool is read by the
+# workers and the callback gets the result in the main thread, where the spool is updated.
+# Returns the number of emails sent and failed
+def dispatch_emails(sessions, jobs, rate_limit=0):
+    pool = queue.Queue()
+    for email in sessions:
+        pool.put(email)
+    limiter = RateLimiter(rate_limit)
+
+    def send(agent_name, parts, repeats):
+        email = pool.get()
+        try:
+            if email.conn is None:
+                email.open()
+            limiter.wait()
+            return send_agent_email(email, agent_name, parts, repeats), email.status
+        except Exception as e:
+            email.close()
+            return False, "%s: %s" % (e.__class__.__name__, e)
+        finally:
+            pool.put(email)
+
+    def finish(future, agent_name, repeats, callback):
+        sent, status = future.result()
+        # Reset the repeated findings reported in the email
+        if sent and dedup_enabled:
+            get_dedup_index().mark_notified(agent_name, repeats)
+        callback(sent, status)
+        results[sent] += 1
+
+    results = {True: 0, False: 0}
+    pending = {}
+    with ThreadPoolExecutor(max_workers=len(sessions)) as executor:
+        for agent_name, parts, callback in jobs:
+            # Keep a few jobs queued per worker, the spool is not loaded at once
+            while len(pending) >= 2 * len(sessions):
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future, *pending.pop(future))
+            repeats = get_dedup_index().agent_repeats(agent_name) if dedup_enabled else ()
+            pending[executor.submit(send, agent_name, parts, repeats)] = (agent_name, repeats, callback)
+        for future in as_completed(list(pending)):
+            finish(future, *pending.pop(future))
+    return results[True], results[False]
+
+
+# Jobs of the spool files of input_dir, one per agent
+def spool_file_jobs():
+    # Claim the files in input_dir, files left by a failed run are sent again
+    extension = get_serializer(input_format).extension
+    files = claim_spool_files(input_dir, extension)
+    if len(files):
+        log("  [+] Found %s %s files" % (str(len(files)), input_format), log_file)
+    else:
+        log("  [!] No %s files found" % input_format.upper(), log_file)
+
+    # Treat every file found, only the files sent are removed
+    for file in files:
+        agent_name = file[:-len(extension + ".sending")]
+        file_path = os.path.join(input_dir, file)
+
+        def done(sent, status, file_path=file_path):
+            if not sent:
+                log("    [X] Error sending email (%s), file '%s' is kept for the next run" % (status, file_path), log_file, ERROR)
+            else:
+                log("    [*] Email sent successfully", log_file)
+                log("    [!] Removing file '%s'" % file_path, log_file)
+                os.remove(file_path)
+
+        log("    [-] Parsing file %s" % file, log_file)
+        yield agent_name, [file_path], done
+
+
+# Jobs of the pending alerts of the SQLite spool, one per agent
+def spool_db_jobs(store):
+    # Alerts claimed by a run that did not finish are sent again
+    released = store.release_stale()
+    if released:
+        log("  [!] Released %s alerts of a previous run" % released, log_file, WARNING)
+    agents = store.pending_agents()
+    if len(agents):
+        log("  [+] Found pending alerts of %s agents" % len(agents), log_file)
+    else:
+        log("  [!] No pending alerts found", log_file)
+
+    # Claim the alerts of every agent and mark them sent once the email is delivered
+    for agent_name in agents:
+        batch, alerts = store.claim(agent_name)
+        if not alerts:
+            continue
+
+        def done(sent, status, batch=batch):
+            if not sent:
+                log("    [X] Error sending email (%s), the alerts are kept for the next run" % status, log_file, ERROR)
+                store.release(batch)
+            else:
+                log("    [*] Email sent successfully", log_file)
+                store.mark_sent(batch)
+
+        log("    [-] Sending %s alerts of agent %s" % (len(alerts), agent_name), log_file)
+        content = "".join(format_alert(alert, input_format)[1] + "\n" for alert in alerts)
+        yield agent_name, [content.encode("utf-8")], done
+
+
+# Send one digest per team with the alerts of its agents, agents not routed to a team go to the default
+# recipients. The spool of the agents is updated once their digest is sent
+def send_digests(email, jobs, digest_conf):
+    teams = digest_conf.get("teams", [])
+    digest_format = digest_conf.get("format", "zip")
+    summary_rows = int(digest_conf.get("summary_rows", 500))
+    default_team = {"name": "", "to": email.email_to}
+    # team name => [team, digest writer, [(agent name, repeats, result callback)]]
+    digests = {}
+    try:
+        for agent_name, parts, callback in jobs:
+            team = route_agent(agent_name, teams) or default_team
+            digest = digests.get(team["name"])
+            if digest is None:
+                name = "cve-digest-" + (re.sub(r"[^\w.-]", "_", team["name"]) + "-" if team["name"] else "") + time.strftime("%Y%m%d-%H%M%S")
+                digest = digests[team["name"]] = [team, DigestWriter(os.path.join(output_tmp, name), digest_format), []]
+            for line in iter_part_lines(parts):
+                if not line:
+                    continue
+                try:
+                    digest[1].add(parse_spool_line(line, input_format))
+                except ValueError as e:
+                    log("    [X] Skipping line of agent %s: %s" % (agent_name, e), log_file, WARNING)
+            repeats = get_dedup_index().agent_repeats(agent_name) if dedup_enabled else ()
+            digest[2].append((agent_name, repeats, callback))
+    finally:
+        for team, writer, agents in digests.values():
+            writer.close()
+
+    for team, writer, agents in digests.values():
+        subject = digest_subject_header + (" " + team["name"] if team["name"] else "")
+        body = html_header + html_digest_body % (len(writer.agents), writer.alerts, writer.severity_totals())
+        repeats = [repeat for agent_name, agent_repeats, callback in agents for repeat in agent_repeats]
+        if repeats:
+            body += html_repeats % (len(repeats), sum(count for key, count in repeats))
+        body += writer.summary_html(summary_rows) + html_footer
+        log("  [-] Sending digest '%s' with %s alerts of %s agents" % (subject, writer.alerts, len(agents)), log_file)
+        try:
+            sent = email.send(subject, body, writer.path, team.get("to") or email.email_to)
+            status = email.status
+        except Exception as e:
+            sent, status = False, "%s: %s" % (e.__class__.__name__, e)
+        finally:
+            os.remove(writer.path)
+        for agent_name, agent_repeats, callback in agents:
+            if sent and dedup_enabled:
+                get_dedup_index().mark_notified(agent_name, agent_repeats)
+            callback(sent, status)
+
+
+# Remove the alerts sent more than spool_retention_days ago from the SQLite spool
+def purge_sent(store):
+    purged = store.purge_sent(spool_retention_days)
+    if purged:
+        log("  [!] Removed %s alerts sent more than %s days ago" % (purged, spool_retention_days), log_file)
+
+
+# Forget the findings not seen for dedup_ttl_days
+def evict_findings():
+    if dedup_enabled:
+        evicted = get_dedup_index().evict()
+        if evicted:
+            log("  [!] Evicted %s findings not seen in %s days" % (evicted, dedup_ttl_days), log_file)
+
+
 def main():
     # Read config JSON file
     conf = read_json(conf_file)
@@ -43,74 +267,51 @@ def main():
 
     # Check SMTP server
     if not email.check_smtp_server():
-        log("  [X] Exiting, SMTP server returned code %s. Using settings:\n%s" % (email.check, json.dumps(conf)), log_file)
+        log("  [X] Exiting, SMTP server returned code %s. Using settings:\n%s" % (email.check, json.dumps(conf)), log_file, ERROR)
         sys.exit(1)
     else:
         log("  [*] SMTP server contacted successfully", log_file)
 
     # Treat input files
     log("  [!] Using %s format" % input_format, log_file)
-    if input_format == "html":  # HTML
-        # Get HTML files in input_dir
-        html_files = get_files_by_extension(input_dir, ".html")
-        if len(html_files):
-            log("  [+] Found %s html files" % str(len(html_files)), log_file)
-        else:
-            log("  [!] No HTML files found", log_file)
-
-        # Treat every HTML file found
-        for file in html_files:
-            log("    [-] Parsing file %s" % file, log_file)
-            agent_name = file.replace(".html", "")
-            file_path = os.path.join(input_dir, file)
-            # Form the HTML body
-            html_content = html_header
-            html_content += html_body.replace("XXAGENTXX", agent_name)
-            html_content += html_table_header
-            html_content += read_text_file(file_path)
-            html_content += html_footer
-            # Send email
-            subject = subject_header + agent_name
-            if not email.send(subject, html_content):
-                log("    [X] Exiting, error sending email", log_file)
+    if input_format not in serializers:
+        log("  [X] Exiting, input format '%s' not identified" % input_format, log_file, ERROR)
+        sys.exit(1)
+
+    # Digest mode, one email per team over one SMTP session
+    digest_conf = conf.get("digest", {})
+    if digest_conf.get("enabled"):
+        log("  [!] Digest mode, format: %s" % digest_conf.get("format", "zip"), log_file)
+        with email:
+            if spool_backend == "sqlite":
+                with AlertStore(spool_db) as store:
+                    send_digests(email, spool_db_jobs(store), digest_conf)
+                    purge_sent(store)
             else:
-                log("    [*] Email sent successfully", log_file)
-                log("    [!] Removing file '%s'" % file_path, log_file)
-                os.remove(file_path)
-    elif input_format == "csv":  # CSV
-        # Get CSV files in input_dir
-        csv_files = get_files_by_extension(input_dir, ".csv")
-        if len(csv_files):
-            log("  [+] Found %s csv files" % str(len(csv_files)), log_file)
+                send_digests(email, spool_file_jobs(), digest_conf)
+        evict_findings()
+        return
+
+    # One SMTP session per worker
+    smtp = conf["mail"]["smtp"]
+    workers = max(1, int(smtp.get("workers", 1)))
+    rate_limit = float(smtp.get("rate_limit", 0))
+    sessions = [email] + [SendEmail(conf) for i in range(workers - 1)]
+    log("  [!] Sending with %s SMTP sessions, rate limit: %s" % (workers, "%s emails/s" % rate_limit if rate_limit else "none"), log_file)
+    start = time.monotonic()
+    try:
+        if spool_backend == "sqlite":
+            with AlertStore(spool_db) as store:
+                sent, failed = dispatch_emails(sessions, spool_db_jobs(store), rate_limit)
+                purge_sent(store)
         else:
-            log("  [!] No CSV files found", log_file)
-
-        # Treat every CSV file found
-        for file in csv_files:
-            log("    [-] Parsing file %s" % file, log_file)
-            agent_name = file.replace(".csv", "")
-            file_path = os.path.join(input_dir, file)
-            # Form the HTML content
-            html_content = html_header
-            html_content += html_body.replace("XXAGENTXX", agent_name) + " Please take a look at the attachment file."
-            html_content += html_footer
-            # Form the CSV content
-            csv_content = csv_header
-            csv_content += read_text_file(file_path)
-            csv_path = os.path.join(output_tmp, file)
-            save_file_to_disk(csv_content, csv_path)
-            # Send email
-            subject = subject_header + agent_name
-            if not email.send(subject, html_content, csv_path):
-                log("    [X] Exiting, error sending email", log_file)
-            else:
-                log("    [*] Email sent successfully", log_file)
-                log("    [!] Removing files '%s' and '%s'" % (file_path, csv_path), log_file)
-                os.remove(file_path)
-                os.remove(csv_path)
-    else:
-        log("  [X] Exiting, input format '%s' not identified" % input_format, log_file)
-        sys.exit(1)
+            sent, failed = dispatch_emails(sessions, spool_file_jobs(), rate_limit)
+    finally:
+        for session in sessions:
+            session.close()
+    if sent or failed:
+        log("  [*] Sent %s emails in %.2fs, %s failed" % (sent, time.monotonic() - start, failed), log_file)
+    evict_findings()
 
 
 if __name__ == "__main__":
@@ -118,5 +319,5 @@ if __name__ == "__main__":
         log("[+] Script started at " + get_time_now(), log_file)
         main()
     except Exception:
-        log("[X] Exiting, an error occurred:\n%s" % traceback.format_exc(), log_file)
+        log("[X] Exiting, an error occurred:\n%s" % traceback.format_exc(), log_file, ERROR)
         raise
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+import csv
+import html
+import json
+import operator
+from alert_store import alert_fields
+
+# orjson writes the JSON lines faster when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Column titles of the alert fields
+field_titles = ["Timestamp", "Rule level", "Rule ID", "Agent ID", "Agent name", "Agent IP", "Wazuh node", "CVE", "Description", "Score", "Severity", "Package name", "Package version", "Package condition"]
+
+
+get_fields = operator.itemgetter(*alert_fields)
+
+
+# Values of an alert in field order. The spools are line based: line breaks inside the values are replaced
+def field_values(info):
+    values = get_fields(info)
+    try:
+        joined = "".join(values)
+    except TypeError:
+        values = [value if type(value) is str else str(value) for value in values]
+        joined = "".join(values)
+    if "\n" in joined or "\r" in joined:
+        values = [value.replace("\r\n", " ").replace("\n", " ").replace("\r", " ") for value in values]
+    return values
+
+
+# Every serializer turns a parsed alert into one spool line and back, and gives the header of the report.
+# The serializers keep no state, they are shared by the sender threads
+class CsvSerializer(object):
+    extension = ".csv"
+
+    def __init__(self):
+        self.header_line = self.format_row(field_titles) + "\n"
+
+    # The line csv.writer writes with quoting=csv.QUOTE_ALL and delimiter ";", the values having no line breaks:
+    # every value is quoted and its quotes doubled. Built with joins, several times faster than csv.writer
+    def format_row(self, values):
+        line = '"' + '";"'.join(values) + '"'
+        if line.count('"') != 2 * len(values):
+            line = '"' + '";"'.join(value.replace('"', '""') for value in values) + '"'
+        return line
+
+    def header(self):
+        return self.header_line
+
+    def line(self, info):
+        return self.format_row(field_values(info))
+
+    def parse(self, line):
+        values = next(csv.reader([line], delimiter=";"))
+        # Lines spooled before the values were quoted
+        if len(values) != len(alert_fields):
+            values = line[1:-1].split('";"')
+        return values
+
+
+class HtmlSerializer(object):
+    extension = ".html"
+
+    def header(self):
+        return "<table class='customTable'><thead><tr><th>" + "</th><th>".join(field_titles) + "</th></tr></thead><tbody>"
+
+    # The values are escaped at once, joined by a control character that is not escaped
+    def line(self, info):
+        return "<tr><td>" + html.escape("\x1f".join(field_values(info))).replace("\x1f", "</td><td>") + "</td></tr>"
+
+    def parse(self, line):
+        return [html.unescape(value) for value in line[len("<tr><td>"):-len("</td></tr>")].split("</td><td>")]
+
+
+# JSON Lines, one object per alert to bulk load the spool in other tools
+class JsonlSerializer(object):
+    extension = ".jsonl"
+
+    def header(self):
+        return ""
+
+    def line(self, info):
+        values = dict(zip(alert_fields, field_values(info)))
+        if orjson is not None:
+            return orjson.dumps(values).decode("utf-8")
+        return json.dumps(values, ensure_ascii=False, separators=(",", ":"))
+
+    def parse(self, line):
+        values = json.loads(line)
+        return [values.get(field, "") for field in alert_fields]
+
+
+serializers = {
+    "csv": CsvSerializer(),
+    "html": HtmlSerializer(),
+    "jsonl": JsonlSerializer()
+}
+
+
+def get_serializer(format):
+    if format not in serializers:
+        raise ValueError("output format '%s' not identified" % format)
+    return serializers[format]
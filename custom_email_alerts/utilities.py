@@ -3,12 +3,80 @@
 import os
 import datetime
 import json
+import atexit
+import fcntl
+import threading
+
+# Log levels
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+# Messages below this level are not logged
+log_level = INFO
+# Log files are rotated when they reach this size, keeping log_backup_count old files (0 disables the rotation)
+log_max_bytes = 10 * 1024 * 1024
+log_backup_count = 3
 
 
 def save_file_to_disk(content, path):
     # Save data to disk
-    check_file_exists(path, create=True)
-    append_file(path, content)
+    spool_append(path, content)
+
+
+# Append text to a spool file with a single O_APPEND write holding an exclusive lock, so concurrent writers never
+# interleave and no line is lost when spool_claim renames the file at the same time
+def spool_append(path, text):
+    data = (text + "\n").encode("utf-8")
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o660)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # The file may have been claimed between the open and the lock, write to the new file instead
+            try:
+                if os.fstat(fd).st_ino != os.stat(path).st_ino:
+                    continue
+            except FileNotFoundError:
+                continue
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            return
+        finally:
+            os.close(fd)
+
+
+# Hand a spool file over to its consumer: the file is renamed to "<path>.sending" under the writers lock, so the
+# writers start a new spool file. A "<path>.sending" left by a failed run gets the new records appended.
+# Returns the path of the file to consume, None if there is nothing to consume.
+def spool_claim(path):
+    sending = path + ".sending"
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return sending if os.path.exists(sending) else None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if os.path.exists(sending):
+            with open(sending, "ab") as f:
+                while True:
+                    chunk = os.read(fd, 1024 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            os.remove(path)
+        else:
+            os.rename(path, sending)
+    finally:
+        os.close(fd)
+    return sending
+
+
+# Claim every spool file of a directory with the given extension, returns the names of the files to consume
+def claim_spool_files(path, extension):
+    for file in get_files_by_extension(path, extension):
+        spool_claim(os.path.join(path, file))
+    return get_files_by_extension(path, extension + ".sending")
 
 
 def get_files_by_extension(path, extension):
@@ -46,6 +114,81 @@ def check_file_exists(file, create=False):
                 f.write("")
 
 
-def log(text, file):
-    check_file_exists(file, create=True)
-    append_file(file, text)
+# Log file kept open in line buffered append mode, rotated by size
+class LogFile(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+        self.lock = threading.Lock()
+
+    def open(self):
+        self.handle = open(self.path, "a", buffering=1)
+
+    def write(self, text):
+        with self.lock:
+            if self.handle is None:
+                self.open()
+            self.handle.write(text + "\n")
+            # In append mode the position is the end of the file, including the lines of other processes
+            if log_max_bytes and self.handle.tell() >= log_max_bytes:
+                self.rotate()
+
+    # Every process writing the log rotates it under an exclusive lock of the file. A process finding that the file was
+    # already rotated by another one, renamed or truncated, only opens the new file
+    def rotate(self):
+        fd = self.handle.fileno()
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            try:
+                rotated = os.stat(self.path).st_ino != os.fstat(fd).st_ino or os.fstat(fd).st_size < log_max_bytes
+            except FileNotFoundError:
+                rotated = True
+            if not rotated:
+                for i in range(log_backup_count - 1, 0, -1):
+                    if os.path.exists("%s.%s" % (self.path, i)):
+                        os.replace("%s.%s" % (self.path, i), "%s.%s" % (self.path, i + 1))
+                if log_backup_count:
+                    os.replace(self.path, self.path + ".1")
+                else:
+                    open(self.path, "w").close()
+        finally:
+            # Closing the file releases the lock
+            self.handle.close()
+        self.open()
+
+    def close(self):
+        with self.lock:
+            if self.handle is not None:
+                self.handle.close()
+                self.handle = None
+
+
+log_files = {}
+log_files_lock = threading.Lock()
+
+
+def set_log_level(level):
+    global log_level
+    log_level = level
+
+
+def is_log_enabled(level):
+    return level >= log_level
+
+
+def log(text, file, level=INFO):
+    if level < log_level:
+        return
+    log_file = log_files.get(file)
+    if log_file is None:
+        with log_files_lock:
+            log_file = log_files.setdefault(file, LogFile(file))
+    log_file.write(text)
+
+
+# Flush and close the log files on exit
+@atexit.register
+def close_logs():
+    for log_file in list(log_files.values()):
+        log_file.close()